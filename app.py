@@ -1,8 +1,14 @@
-import pandas as pd
+from functools import partial
+
 import streamlit as st
 from streamlit_option_menu import option_menu
 from streamlit_gsheets import GSheetsConnection
-from utils import preprocess_data
+from store.cache import DataCache, DataLoadError
+from store.dataset import build_dataset, frame_worksheets
+from store.incremental import IncrementalReader
+from store.loader import LoadReport, read_csv_worksheet
+from store.snapshot import has_snapshots, load_snapshots, write_snapshots
+from constants import DATA_TTL, DATA_SOURCE, SNAPSHOT_DIR, CSV_DIR, MMAP_SALES
 
 from views import *
 
@@ -32,57 +38,101 @@ with st.sidebar:
     st.write("# ")
 
 # ----------------------------------- Data Loading ------------------------------
-# Create a connection object.
-conn = st.connection("gsheets", type=GSheetsConnection)
-balance_data = conn.read(
-    worksheet="balance_sheet",
-)
-income_data = conn.read(
-    worksheet="income_data",
-)
-cash_data = conn.read(
-    worksheet="cash_flow"
-)
-customers_data = conn.read(
-    worksheet="customers_report"
-)
-sales_data = conn.read(
-    worksheet="sales_report"
-)
-products_data = conn.read(
-    worksheet="products_data"
-)
-market_data = conn.read(
-    worksheet="market_data"
-)
-media_data = conn.read(
-    worksheet="media_data"
-)
-
-# --------------------------- Data Pre-processing -------------------------------
-
-customers_sales_data = pd.merge(customers_data, sales_data, on='Customer_ID')
-(balance_data, income_data, cash_data, customers_sales_data,
- market_data, media_data) = preprocess_data([balance_data, income_data, cash_data,
-                                             customers_sales_data, market_data, media_data])
-temp_df = pd.merge(income_data, balance_data, on=["Valuation Date", "Year", "Month"])
-cash_flow_data = pd.merge(temp_df, cash_data, on=["Valuation Date", "Year", "Month"])
+@st.cache_resource
+def get_reader() -> IncrementalReader:
+    """
+    One IncrementalReader per process, it remembers how far the append-only
+    worksheets were read so refreshes only parse their new rows
+    """
+    if DATA_SOURCE == "csv":
+        return IncrementalReader(lambda name, **options: read_csv_worksheet(CSV_DIR, name, **options),
+                                 directory=None)
+    # Create a connection object.
+    conn = st.connection("gsheets", type=GSheetsConnection)
+    # conn.read's own cache is bypassed, the DataCache decides when to re-read.
+    return IncrementalReader(lambda name, **options: conn.read(worksheet=name, ttl=0, **options),
+                             directory=SNAPSHOT_DIR)
+
+
+@st.cache_resource
+def get_data_cache(worksheets: tuple) -> DataCache:
+    """
+    One DataCache per group of worksheets and process, shared by every session.
+    Pages that need the same frames share the same cache.
+    :param worksheets: names of the worksheets the cached frames are built from
+    """
+    build = partial(build_dataset, mapped=["customers_sales_data"] if MMAP_SALES else [],
+                    directory=SNAPSHOT_DIR)
+    if DATA_SOURCE == "snapshot":
+        return DataCache(fetch=lambda: load_snapshots(SNAPSHOT_DIR, worksheets), build=build, ttl=DATA_TTL)
+    reader = get_reader()
+    if DATA_SOURCE == "csv":
+        return DataCache(fetch=lambda: reader.load(worksheets), build=build, ttl=DATA_TTL,
+                         on_built=lambda report: reader.commit(report, worksheets))
+    # Start from the local snapshots when present and refresh them from the sheets.
+    return DataCache(fetch=lambda: reader.load(worksheets), build=build, ttl=DATA_TTL,
+                     on_built=lambda report: reader.commit(report, worksheets),
+                     warm_start=lambda: load_snapshots(SNAPSHOT_DIR, worksheets)
+                     if has_snapshots(SNAPSHOT_DIR, worksheets) else LoadReport(),
+                     on_update=lambda frames, revisions: write_snapshots(frames, revisions, SNAPSHOT_DIR))
+
+
+def page_caches(page) -> dict:
+    """
+    The DataCaches holding the frames a page reads
+    :param page: a view function, its name is looked up in PAGE_DATA
+    :return: DataCache -> names of the frames to take from it
+    """
+    caches = {}
+    for frame in PAGE_DATA[page.__name__]:
+        caches.setdefault(get_data_cache(frame_worksheets([frame])), []).append(frame)
+    return caches
+
 
 # ----------------------------------- Menu --------------------------------------
-menu = option_menu(menu_title=None, menu_icon=None, orientation="horizontal",
-                   options=["Overview", "Sales Insights", "Customer's Report",
-                            "Demand Elasticity", "Marketing Attribution"])
-
-match menu:
-    case "Overview":
-        overview(customers_sales_data, cash_flow_data)
-    case "Sales Insights":
-        sales_insights(customers_sales_data)
-    case "Customer's Report":
-        customer_report(customers_sales_data)
-    case "Demand Elasticity":
-        demand_elasticity(products_data)
-    case "Marketing Attribution":
-        marketing_attribution(market_data, media_data)
-    # case "Accounts":
-    #     accounts(cash_flow_data)
+PAGES = {
+    "Overview": overview,
+    "Sales Insights": sales_insights,
+    "Customer's Report": customer_report,
+    "Demand Elasticity": demand_elasticity,
+    "Marketing Attribution": marketing_attribution,
+    # "Accounts": accounts,
+}
+menu = option_menu(menu_title=None, menu_icon=None, orientation="horizontal", options=list(PAGES))
+page = PAGES[menu]
+caches = page_caches(page)
+
+with st.sidebar:
+    if st.button("Refresh data"):
+        # A manual refresh re-reads the append-only worksheets in full too
+        if DATA_SOURCE != "snapshot":
+            get_reader().reset()
+        for data_cache in caches:
+            data_cache.refresh()
+
+frames = {}
+for data_cache, names in caches.items():
+    try:
+        dataset = data_cache.get()
+    except DataLoadError as e:
+        for message in e.report.error_messages():
+            st.error(message)
+        continue
+    loaded = [name for name in names if name in dataset.frames]
+    if len(loaded) < len(names):
+        # Built from the worksheets that loaded, the failed ones are behind the missing frames
+        for message in data_cache.last_report.error_messages():
+            st.error(message)
+    elif not data_cache.last_report.ok:
+        st.sidebar.warning("Some worksheets could not be refreshed, showing cached data.")
+    frames.update({name: dataset[name] for name in loaded})
+
+with st.sidebar.expander("Load timings"):
+    for data_cache in caches:
+        if data_cache.last_report is not None:
+            for name, seconds in data_cache.last_report.timings.items():
+                st.write(f"- {name}: {seconds:.2f}s")
+
+if any(name not in frames for name in PAGE_DATA[page.__name__]):
+    st.stop()
+page(*[frames[name] for name in PAGE_DATA[page.__name__]])
@@ -0,0 +1,119 @@
+"""
+Time and peak memory of the overview KPIs on synthetic transactions, compared
+with the per-metric implementations they replaced. The legacy
+average_life_span merges the per-customer lifespans back onto every
+transaction, so its memory grows with the transactions, not the customers.
+
+Usage (from the repository root):
+    python -m benchmarks.kpis --rows 100000 1000000
+"""
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from constants import MONTHS
+from plots.kpis import average_life_span
+from store.schema import CHURN_THRESHOLD
+from utils import get_overview_kpis, month_names
+
+
+def legacy_average_life_span(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> dict:
+    """
+    The lifespan computation average_life_span replaced, kept for comparison
+    """
+    cust_lsp_current = current_data.groupby(
+        'Customer_ID', observed=True)['Valuation Date'].agg(['min', 'max']).reset_index()
+    cust_lsp_current['lifespan'] = cust_lsp_current['max'] - cust_lsp_current['min']
+    cust_lsp_current['lifespan'] = cust_lsp_current['lifespan'].apply(lambda x: x.days)
+    avg_lsp_current = cust_lsp_current['lifespan'].mean()
+    cust_lsp_prev = previous_data.groupby('Customer_ID', observed=True)['Valuation Date'].agg([
+        'min', 'max']).reset_index()
+    cust_lsp_prev['lifespan'] = cust_lsp_prev['max'] - cust_lsp_prev['min']
+    cust_lsp_prev['lifespan'] = cust_lsp_prev['lifespan'].apply(lambda x: x.days)
+    avg_lsp_prev = cust_lsp_prev['lifespan'].mean()
+    cust_lsp_current = cust_lsp_current.merge(current_data, on="Customer_ID")
+    y_data = cust_lsp_current.groupby("Valuation Date")["lifespan"].mean().reset_index()
+    y_data["Month"] = y_data["Valuation Date"].dt.month
+    y_data = y_data.groupby("Month")["lifespan"].mean().reset_index()
+    y_data['Month'] = y_data['Month'].apply(lambda x: MONTHS[x - 1])
+    return {"value": avg_lsp_current, "reference": avg_lsp_prev,
+            "months": y_data["Month"].to_numpy(), "series": y_data["lifespan"].to_numpy()}
+
+
+def synthetic_period(rows: int, customers: int, year: int, seed: int = 0) -> pd.DataFrame:
+    """
+    One year of joined sales with the columns of customers_sales_data
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D").to_numpy()
+
+    def labels(values, n):
+        return pd.Categorical.from_codes(rng.integers(0, len(values), n), categories=values)
+
+    ids = [f"CUST_{i:06d}" for i in range(customers)]
+    profiles = pd.DataFrame({
+        "Dash Segment": labels(["New", "Regular", "Loyal", "VIP", "At Risk"], customers),
+        "Loyalty Group": labels(["Bronze", "Silver", "Gold", "Platinum"], customers),
+        "CLTV Monetary Value": rng.lognormal(6, 1, customers),
+        "P notAlive": rng.uniform(0, 1, customers).astype("float32"),
+    })
+    customer = rng.integers(0, customers, rows)
+    df = pd.DataFrame({
+        "Customer_ID": pd.Categorical.from_codes(customer, categories=ids),
+        "Valuation Date": dates[rng.integers(0, len(dates), rows)],
+        **{col: profiles[col].to_numpy()[customer] for col in profiles},
+        "Product Item Name": labels([f"eBay Item Name {i}" for i in range(20)], rows),
+        "Conversion Country": labels(["US", "UK", "CA", "AU", "DE", "FR", "IT", "ES"], rows),
+        **{col: rng.uniform(1, 500, rows) for col in ["Total Revenue_y", "Gross Profit", "Shipping Amount",
+                                                        "Tax", "Discount"]},
+    }).sort_values(["Valuation Date", "Customer_ID"], ignore_index=True)
+    return df.assign(Year=np.int16(year), Month=month_names(df["Valuation Date"]),
+                     Churn=(df["P notAlive"] > CHURN_THRESHOLD).astype("int8"))
+
+
+def measure(fn) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak / 2 ** 20}
+
+
+def run(rows: int, customers: int = None) -> list:
+    customers = customers or max(rows // 40, 1)
+    current = synthetic_period(rows, customers, 2023, seed=0)
+    previous = synthetic_period(rows, customers, 2022, seed=1)
+    steps = [
+        ("average_life_span (legacy)", lambda: legacy_average_life_span(current, previous)),
+        ("average_life_span", lambda: average_life_span(current, previous)),
+        ("get_overview_kpis", lambda: get_overview_kpis(current, previous)),
+    ]
+    return [{"step": name, "rows": rows, "customers": customers, **measure(fn)} for name, fn in steps]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--customers", type=int, help="distinct customers, defaults to rows / 40")
+    args = parser.parse_args()
+
+    print(f"{'step':<30}{'rows':>12}{'customers':>11}{'seconds':>10}{'peak MB':>10}")
+    for rows in args.rows:
+        for result in run(rows, args.customers):
+            print(f"{result['step']:<30}{result['rows']:>12,}{result['customers']:>11,}"
+                  f"{result['seconds']:>10.2f}{result['peak_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
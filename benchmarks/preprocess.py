@@ -0,0 +1,78 @@
+"""
+Throughput of utils.preprocess_data on synthetic frames.
+
+Usage (from the repository root):
+    python -m benchmarks.preprocess --rows 1000000 10000000
+    python -m benchmarks.preprocess --rows 1000000 --legacy
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import preprocess_data
+
+
+def legacy_preprocess_data(data_list: list) -> list:
+    """
+    The row-wise implementation preprocess_data replaced, kept for comparison
+    """
+    for df in data_list:
+        for col in df.columns:
+            if 'key' in col.lower():
+                try:
+                    df['Date'] = df[col].apply(lambda x: x.split("_")[0])
+                    df['Date'] = pd.to_datetime(df['Date'])
+                    df['Year'] = df['Date'].dt.year
+                    df['Month'] = df['Date'].dt.month_name().str[:3]
+                except IndexError:
+                    continue
+            if 'date' in col.lower():
+                df[col] = pd.to_datetime(df[col])
+                df['Year'] = df[col].dt.year
+                df['Month'] = df[col].dt.month_name().str[:3]
+    return data_list
+
+
+def synthetic_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Frame shaped like the sheets: a "<date>_<customer>" key and a date column, both as text
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-01", "2024-12-31", freq="D").strftime("%Y-%m-%d").to_numpy()
+    picked = dates[rng.integers(0, len(dates), rows)]
+    customers = np.char.add("CUST_", rng.integers(0, 10_000, rows).astype(str))
+    return pd.DataFrame({
+        "Record Key": np.char.add(np.char.add(picked.astype(str), "_"), customers),
+        "Valuation Date": picked,
+        "Total Revenue": rng.uniform(10, 500, rows),
+    })
+
+
+def run(rows: int, legacy: bool = False) -> dict:
+    df = synthetic_frame(rows)
+    fn = legacy_preprocess_data if legacy else preprocess_data
+    start = time.perf_counter()
+    fn([df])
+    elapsed = time.perf_counter() - start
+    return {"implementation": "legacy" if legacy else "vectorized", "rows": rows,
+            "seconds": elapsed, "rows_per_sec": rows / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--legacy", action="store_true", help="also time the row-wise implementation")
+    args = parser.parse_args()
+
+    print(f"{'implementation':<15}{'rows':>12}{'seconds':>10}{'rows/sec':>14}")
+    for rows in args.rows:
+        for legacy in ([False, True] if args.legacy else [False]):
+            result = run(rows, legacy)
+            print(f"{result['implementation']:<15}{result['rows']:>12,}{result['seconds']:>10.2f}"
+                  f"{result['rows_per_sec']:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
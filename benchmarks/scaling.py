@@ -0,0 +1,325 @@
+"""
+Scaling benchmark: runs the compute path behind every page, KPI function and
+chart builder headless on data from Data_Add/manu.py at several scales, and
+records wall time, peak memory and rows/sec per step.
+
+The generator builds the 1x dataset (its defaults: 1,000 customers, about
+50 sales and 100 marketing events per day from 2022-01 to 2024-02). Larger
+scales replicate customers, their sales and the marketing events under new
+ids, so every scale has the same date range and N times the rows.
+
+Usage (from the repository root):
+    python -m benchmarks.scaling --scales 1 10 100 --output scaling.json
+    python -m benchmarks.scaling --scales 1 --only kpi
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+from streamlit.config import set_option
+from streamlit.logger import set_log_level
+
+import utils
+import views
+from plots import accounts, customer_report, demand_elasticity, kpis, marketing, overview, sales_report
+from store import attribution, cube, daily, elasticity, funnel
+from store.dataset import prepare_frames
+from store.partitions import YearPartitions
+
+STATEMENT_COLUMNS = {
+    "income_data": ["Rev", "Profit or Loss", "WageExp", "AdSpend", "BankFees", "DepExp", "Rent", "Supplies",
+                    "Utils", "PayrollTax", "OthExp", "ReturnAllow", "CGS", "Income Before Tax", "IncomeTax"],
+    "balance_sheet": ["AP", "AL", "TP", "WP", "NP", "Stock", "Retained Earnings", "Distributable Earnings",
+                      "Increase in TP", "Increase in WP"],
+    "cash_flow": ["Cash", "Cash for Payroll", "Petty Cash", "Marketable Securities", "AR", "Inventory", "Allow",
+                  "Prepaid", "FixAsset", "AccumDep", "OtherAssets", "Net Earnings", "Decrease in AR",
+                  "Depreciations", "Increase in Inventory", "Increase Marketable Securities",
+                  "Increase Allowance for Bad Debt", "Increase Prepaid Expenses", "Net Asset Acquisitions",
+                  "Net Asset Sale", "Notes Payable", "Decrease in Note Payable", "New Stock Sold",
+                  "New Stock Repurchase"],
+}
+
+
+def generate_base(seed: int = 0) -> dict:
+    """
+    The 1x worksheets, generated with CFODashboardDataGenerator
+    :return: generator output name -> DataFrame
+    """
+    from Data_Add.manu import CFODashboardDataGenerator
+
+    np.random.seed(seed)
+    # The generator creates a "data" directory in the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            generator = CFODashboardDataGenerator()
+        finally:
+            os.chdir(cwd)
+    events, media = generator.generate_marketing_data()
+    return {
+        "customers": generator.generate_customer_data(),
+        "sales": generator.generate_sales_data(),
+        "events": events,
+        "media": media,
+        "financial": generator.generate_financial_data(),
+    }
+
+
+def _replicate(df: pd.DataFrame, factor: int, id_column: str = None) -> pd.DataFrame:
+    copies = []
+    for i in range(factor):
+        copy = df.copy()
+        if id_column is not None and i:
+            copy[id_column] = copy[id_column] + f"_{i}"
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def _statements(financial: pd.DataFrame) -> dict:
+    """
+    Splits the generator's monthly financials into the three statement worksheets.
+    Statement columns the generator does not produce are filled with zeros.
+    """
+    statements = {}
+    keys = pd.DataFrame({"Valuation Date": financial["Valuation Date"].dt.strftime("%Y-%m-%d")})
+    for name, columns in STATEMENT_COLUMNS.items():
+        statements[name] = keys.assign(**{col: financial[col] if col in financial else 0.0 for col in columns})
+    return statements
+
+
+def scale_worksheets(base: dict, factor: int) -> dict:
+    """
+    Builds the app's worksheets at factor times the rows of the base dataset
+    :param base: output of generate_base
+    :param factor: scale factor
+    :return: worksheet name -> raw DataFrame, with text dates like the sheets
+    """
+    customers = _replicate(base["customers"], factor, "Customer ID").rename(columns={"Customer ID": "Customer_ID"})
+    sales = _replicate(base["sales"], factor, "Customer ID").rename(columns={"Customer ID": "Customer_ID"})
+    sales["Valuation Date"] = sales["Valuation Date"].dt.strftime("%Y-%m-%d")
+    events = _replicate(base["events"], factor)
+    events["Event DateTime"] = events["Event DateTime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    media = base["media"].assign(Date=base["media"]["Date"].dt.strftime("%Y-%m-%d"))
+    products = pd.read_csv(os.path.join("Data_Add", "data", "products_data.csv"))
+    return {
+        **_statements(base["financial"]),
+        "customers_report": customers,
+        "sales_report": sales,
+        "products_data": products,
+        "market_data": events,
+        "media_data": media,
+    }
+
+
+def steps(frames: dict) -> list:
+    """
+    Every benchmarked step with its input, mirroring what the pages pass in
+    :param frames: prepared frames, as returned by prepare_frames
+    :return: list of (kind, name, callable, rows)
+    """
+    customers_sales = frames["customers_sales_data"]
+    cash_flow = frames["cash_flow_data"]
+    products = frames["products_data"]
+    market, media = frames["market_data"], frames["media_data"]
+    sales_cube, market_cube, products_cube = frames["sales_cube"], frames["market_cube"], frames["products_cube"]
+    products_elasticity = elasticity.products_elasticity(products)
+    # build_dataset splits the sales by year and sums them per day once per data version
+    sales_by_year = YearPartitions(customers_sales, "Valuation Date")
+    sales_daily, market_daily = daily.sales_daily(customers_sales), daily.market_daily(market)
+    media_daily, market_hourly = daily.media_daily(media), daily.market_hourly(market)
+    market_funnel, market_journeys = funnel.market_funnel(market), attribution.market_journeys(market)
+
+    years = sales_by_year.years
+    # The busiest year, the generated data ends early in its last year
+    year = customers_sales["Year"].value_counts().idxmax()
+    dates = (pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31))
+    current, previous = utils.current_and_previous_data(sales_by_year, dates=dates)
+
+    def copy(df):
+        # Some builders add columns to their input, so each call gets its own frame
+        return lambda: df.copy()
+
+    cash_frame, product_frame = copy(cash_flow), copy(products)
+    n_sales, n_market = len(customers_sales), len(market)
+    n_current = len(current) + len(previous)
+    # Cube charts and metrics cost O(cells), rows counts the transactions the cube stands for
+    result = [
+        ("page", "views.overview", lambda: views.overview(sales_by_year, cash_flow, sales_cube, sales_daily),
+         n_sales),
+        ("page", "views.sales_insights", lambda: views.sales_insights(sales_cube, sales_daily, sales_by_year),
+         n_sales),
+        ("page", "views.customer_report", lambda: views.customer_report(sales_cube, sales_daily), n_sales),
+        ("page", "views.demand_elasticity",
+         lambda: views.demand_elasticity(products, products_cube, products_elasticity), len(products)),
+        ("page", "views.marketing_attribution",
+         lambda: views.marketing_attribution(market_cube, market_daily, media_daily, market_funnel,
+                                             market_journeys), n_market),
+        ("page", "views.accounts", lambda: views.accounts(cash_frame()), len(cash_flow)),
+    ]
+    result.append(("kpi", "utils.current_and_previous_data (masks)",
+                   lambda: utils.current_and_previous_data(customers_sales, year, years), n_sales))
+    result.append(("kpi", "utils.current_and_previous_data", lambda: utils.current_and_previous_data(
+        sales_by_year, year), n_sales))
+    result.append(("kpi", "utils.current_and_previous_data (dates)", lambda: utils.current_and_previous_data(
+        sales_by_year, dates=dates), n_sales))
+    for fn in [kpis.get_num_of_customers, kpis.get_clv, kpis.average_life_span, kpis.average_arpu,
+               kpis.churn_rate, utils.get_overview_kpis]:
+        result.append(("kpi", f"{fn.__module__}.{fn.__name__}", lambda fn=fn: fn(current, previous), n_current))
+    for fn in [utils.get_conversion_rate, utils.get_aov, utils.shipping_amount, utils.tax_amount,
+               utils.gross_profit_margin, utils.get_discount_rate]:
+        result.append(("metric", f"utils.{fn.__name__}", lambda fn=fn: fn(sales_cube.rollup(year=year)), n_sales))
+    result.append(("metric", "store.daily.DailyTotals.totals", lambda: sales_daily.totals(*dates), n_sales))
+    for fn in [utils.get_conv_rate, utils.get_visitor_engagement]:
+        result.append(("metric", f"utils.{fn.__name__}", lambda fn=fn: fn(market_daily.totals()), n_market))
+
+    charts = [
+        (overview.income_statement, cash_frame), (overview.debt_and_equity, cash_frame),
+        (demand_elasticity.elasticity_vs_base_price, product_frame),
+        (demand_elasticity.shipping_vs_tax_ratio, product_frame),
+        (accounts.expense_treemap, cash_frame), (accounts.expenses_by_category, cash_frame),
+        (accounts.cashflows_pie, cash_frame), (accounts.cashflow_chart, cash_frame),
+        (accounts.ar_indicator, cash_frame), (accounts.ap_indicator, cash_frame),
+        (accounts.profit_loss_chart, cash_frame),
+    ]
+    for fn, make_input in charts:
+        rows = len(make_input())
+        result.append(("chart", f"{fn.__module__}.{fn.__name__}",
+                       lambda fn=fn, make_input=make_input: fn(make_input()), rows))
+    for fn in [overview.clv_by_cac_chart, sales_report.monthly_gross_rev, sales_report.cost_breakdown_chart,
+               sales_report.sales_by_location, sales_report.rev_by_products, customer_report.churn_wrt_loyalty,
+               customer_report.churn_by_dash_segment, customer_report.sales_by_dash_segment,
+               customer_report.rev_by_dash_segment, customer_report.rev_by_loyalty_group,
+               customer_report.cltv_by_month, customer_report.conversion_and_purchase_rates]:
+        result.append(("chart", f"{fn.__module__}.{fn.__name__}", lambda fn=fn: fn(sales_cube, dates), n_sales))
+    result.append(("chart", "plots.demand_elasticity.price_elasticity_overtime",
+                   lambda: demand_elasticity.price_elasticity_overtime(products_elasticity), len(products)))
+    for fn in [demand_elasticity.sales_volume_overtime, demand_elasticity.price_and_qty_overtime]:
+        result.append(("chart", f"{fn.__module__}.{fn.__name__}", lambda fn=fn: fn(products_cube), len(products)))
+    result.append(("chart", "plots.customer_report.group_analysis",
+                   lambda: customer_report.group_analysis(sales_cube, dates, "Dash Segment"), n_sales))
+    for fn in [marketing.event_seq_pie, marketing.channels_performance, marketing.aov_by_channels]:
+        result.append(("chart", f"{fn.__module__}.{fn.__name__}", lambda fn=fn: fn(market_cube), n_market))
+    result.append(("chart", "plots.marketing.channel_funnel",
+                   lambda: marketing.channel_funnel(media_daily, market_funnel), n_market))
+    result.append(("chart", "plots.marketing.event_seq_funnel", lambda: marketing.event_seq_funnel(market_funnel),
+                   n_market))
+    for fn in [marketing.attribution_by_channel, marketing.channel_removal_effects]:
+        result.append(("chart", f"{fn.__module__}.{fn.__name__}", lambda fn=fn: fn(market_journeys), n_market))
+    result.append(("chart", "utils.get_attribution_indicators", lambda: utils.get_attribution_indicators(
+        market_hourly, "AOV", "Average Order Value", 0, "$"), n_market))
+    return result
+
+
+def measure(fn, repeat: int = 1) -> dict:
+    """
+    Best wall time over repeat runs, then peak memory of one run traced with tracemalloc
+    """
+    seconds = float("inf")
+    # Keep debug prints of the chart builders out of the report table
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            seconds = min(seconds, time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak / 2 ** 20}
+
+
+def run(scales, repeat: int = 1, only=None, seed: int = 0) -> dict:
+    """
+    Runs every step at every scale
+    :param scales: scale factors, e.g. [1, 10, 100]
+    :param repeat: timed runs per step, the best one is reported
+    :param only: kinds of steps to run (ingest, page, kpi, metric, chart), defaults to all
+    :return: report with environment details and one result per (scale, step)
+    """
+    base = generate_base(seed)
+    results = []
+    for scale in scales:
+        raw = scale_worksheets(base, scale)
+        frames = prepare_frames(raw)
+        ingest = [("ingest", "store.dataset.prepare_frames", lambda: prepare_frames(raw),
+                   sum(len(df) for df in raw.values())),
+                  ("ingest", "store.cube.sales_cube", lambda: cube.sales_cube(frames["customers_sales_data"]),
+                   len(frames["customers_sales_data"])),
+                  ("ingest", "store.cube.sales_cube (hll)",
+                   lambda: cube.sales_cube(frames["customers_sales_data"], sketch="hll"),
+                   len(frames["customers_sales_data"])),
+                  ("ingest", "store.cube.market_cube", lambda: cube.market_cube(frames["market_data"]),
+                   len(frames["market_data"])),
+                  ("ingest", "store.daily.sales_daily", lambda: daily.sales_daily(frames["customers_sales_data"]),
+                   len(frames["customers_sales_data"])),
+                  ("ingest", "store.elasticity.products_elasticity",
+                   lambda: elasticity.products_elasticity(frames["products_data"]), len(frames["products_data"])),
+                  ("ingest", "store.funnel.market_funnel", lambda: funnel.market_funnel(frames["market_data"]),
+                   len(frames["market_data"])),
+                  ("ingest", "store.attribution.market_journeys",
+                   lambda: attribution.market_journeys(frames["market_data"]), len(frames["market_data"])),
+                  ("ingest", "store.daily.market_hourly", lambda: daily.market_hourly(frames["market_data"]),
+                   len(frames["market_data"]))]
+        for kind, name, fn, rows in ingest + steps(frames):
+            if only and kind not in only:
+                continue
+            result = {"scale": scale, "kind": kind, "step": name, "rows": rows}
+            try:
+                result.update(measure(fn, repeat))
+                result["rows_per_sec"] = rows / result["seconds"] if result["seconds"] else None
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            results.append(result)
+            print(format_result(result), flush=True)
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    if "error" in result:
+        return f"{result['scale']:>6}x  {result['step']:<50}{result['rows']:>12,}  {result['error'][:60]}"
+    return (f"{result['scale']:>6}x  {result['step']:<50}{result['rows']:>12,}{result['seconds']:>10.3f}"
+            f"{result['peak_mb']:>11.1f}{result['rows_per_sec']:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per step, the best one is reported")
+    parser.add_argument("--only", nargs="+", choices=["ingest", "page", "kpi", "metric", "chart"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    # The pages run without a Streamlit server; silence its bare-mode warnings
+    set_option("global.showWarningOnDirectExecution", False)
+    set_log_level("error")
+    warnings.filterwarnings("ignore")
+    print(f"{'scale':>7}  {'step':<50}{'rows':>12}{'seconds':>10}{'peak MB':>11}{'rows/sec':>14}")
+    report = run(args.scales, args.repeat, args.only, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
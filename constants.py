@@ -1,3 +1,37 @@
+import os
+
 MONTHS = ["Jan", "Feb", "Mar", "Apr", "May",
           "Jun", "Jul", "Aug", "Sep", "Oct",
-          "Nov", "Dec"]
\ No newline at end of file
+          "Nov", "Dec"]
+
+WORKSHEETS = ["balance_sheet", "income_data", "cash_flow", "customers_report",
+              "sales_report", "products_data", "market_data", "media_data"]
+
+# Seconds before the worksheets are fetched again
+DATA_TTL = 600
+
+# Where the dashboard reads its data from: "gsheets", "snapshot" or "csv"
+DATA_SOURCE = os.environ.get("DATA_SOURCE", "gsheets")
+# Local columnar copies of the worksheets
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", ".snapshots")
+# CSV exports used when running offline
+CSV_DIR = os.environ.get("CSV_DIR", "Data_Add/data")
+# Keep the sales transaction table (customers_sales_data) in a memory-mapped
+# Arrow file in SNAPSHOT_DIR, shared by every session and worker process
+MMAP_SALES = os.environ.get("MMAP_SALES", "0") == "1"
+# Distinct-customer sketches of the KPI cubes: "exact" keeps every customer of
+# a cell, "hll" keeps a fixed-size HyperLogLog sketch per cell, approximate
+# within a few percent
+CUSTOMER_SKETCH = os.environ.get("CUSTOMER_SKETCH", "exact")
+# Figures cached across reruns and sessions (plots/figures.py): cap on their
+# serialized size in MB and on their number
+FIGURE_CACHE_MB = int(os.environ.get("FIGURE_CACHE_MB", "64"))
+FIGURE_CACHE_ENTRIES = 512
+# Line and scatter traces are reduced to about this many points before they are
+# sent to the browser (plots/downsample.py); traces with more than
+# WEBGL_TRACE_POINTS points are drawn with WebGL
+MAX_TRACE_POINTS = int(os.environ.get("MAX_TRACE_POINTS", "2000"))
+WEBGL_TRACE_POINTS = 1000
+# Days after which a touch gets half the time-decay attribution credit of the
+# converting one (store/attribution.py)
+ATTRIBUTION_HALF_LIFE_DAYS = 7
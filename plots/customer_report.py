@@ -1,13 +1,12 @@
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from utils import update_hover_layout
-from constants import MONTHS
+from utils import month_axis, update_hover_layout
+from store.cube import CUSTOMERS, PERIOD_KEYS, REPEAT_CUSTOMERS, REPEAT_PURCHASES, ROWS, count_column
 
 
-def churn_wrt_loyalty(data):
-    loyalty_churn = data.groupby("Loyalty Group")["Churn"].sum().reset_index()
+def churn_wrt_loyalty(cube, dates=None):
+    loyalty_churn = cube.rollup(["Loyalty Group"], dates=dates)["Churn"].reset_index()
     loyalty_churn = loyalty_churn.sort_values(by="Churn")
     fig = go.Figure(
         go.Bar(
@@ -19,8 +18,9 @@ def churn_wrt_loyalty(data):
     return fig
 
 
-def churn_by_dash_segment(data):
-    fig = px.pie(data_frame=data, names="Dash Segment", values="Churn", labels="value+percent",
+def churn_by_dash_segment(cube, dates=None):
+    churn_by_segment = cube.rollup(["Dash Segment"], dates=dates)["Churn"].reset_index()
+    fig = px.pie(data_frame=churn_by_segment, names="Dash Segment", values="Churn", labels="value+percent",
                  title="Customer Churn w.r.t Dash Segment", hole=0.3,
                  color_discrete_sequence=["#0fa3b1", "#b5e2fa", "#eddea4", "#f7a072", "#f9f7f3",
                                           "teal", "silver", "#f2cc8f", "#81b29a"])
@@ -28,31 +28,31 @@ def churn_by_dash_segment(data):
     return fig
 
 
-def sales_by_dash_segment(data):
-    data["Month"] = data["Month"].apply(lambda x: MONTHS[x-1])
-    revenue_by_loyalty_and_month = data.groupby(["Dash Segment", "Month"])[
-        'CLTV Monetary Value'].sum().unstack()
-    revenue_by_loyalty_and_month = revenue_by_loyalty_and_month.transpose()
+def sales_by_dash_segment(cube, dates=None):
+    # Months as rows, one column per Dash Segment
+    revenue_by_loyalty_and_month = cube.rollup(PERIOD_KEYS + ["Dash Segment"], dates=dates)[
+        'CLTV Monetary Value'].unstack()
+    months = month_axis(revenue_by_loyalty_and_month.index.get_level_values("Year"),
+                        revenue_by_loyalty_and_month.index.get_level_values("Month"))
     fig = go.Figure()
     colors = ["#0fa3b1", "#b5e2fa", "#eddea4", "#f7a072", "#f9f7f3"]
     x = 0
     for i in revenue_by_loyalty_and_month.columns:
         fig.add_trace(go.Bar(
-            x=revenue_by_loyalty_and_month.index,
+            x=months,
             y=revenue_by_loyalty_and_month[i],
             name=i,
             marker=dict(color=colors[x])
         ))
         x += 1
     fig = update_hover_layout(fig)
-    fig.update_xaxes(categoryorder='array', categoryarray=MONTHS)
     fig.update_layout(title="Sales w.r.t Dash Segment")
     return fig
 
 
-def rev_by_dash_segment(data):
-    revenue_by_dash_segment = data.groupby(
-        'Dash Segment')['Total Revenue_y'].sum().reset_index()
+def rev_by_dash_segment(cube, dates=None):
+    revenue_by_dash_segment = cube.rollup(
+        ['Dash Segment'], dates=dates)['Total Revenue_y'].reset_index()
     fig = px.pie(
         revenue_by_dash_segment,
         names=revenue_by_dash_segment["Dash Segment"],
@@ -64,10 +64,10 @@ def rev_by_dash_segment(data):
     return fig
 
 
-def group_analysis(data, group):
+def group_analysis(cube, dates, group):
+    by_group = cube.rollup([group], dates=dates)
     # Revenue by Group
-    revenue_by_dash_segment = data.groupby(
-        group)['Total Revenue_y'].sum().reset_index()
+    revenue_by_dash_segment = by_group['Total Revenue_y'].reset_index()
     revenue_pie = go.Pie(
         labels=revenue_by_dash_segment[group],
         values=revenue_by_dash_segment["Total Revenue_y"],
@@ -76,10 +76,11 @@ def group_analysis(data, group):
                     "#f7a072", "#f9f7f3", "#eddea4", "#f2bf8b"])
     )
 
-    # Customer Churn by Group
+    # Customer Churn by Group, aggregated so the slices don't depend on row order
+    churn_by_group = by_group["Churn"].reset_index()
     churn_pie = go.Pie(
-        labels=data[group],
-        values=data["Churn"],
+        labels=churn_by_group[group],
+        values=churn_by_group["Churn"],
         hole=0.3,
         marker=dict(colors=["#0fa3b1", "#b5e2fa", "#eddea4",
                     "#f7a072", "#f9f7f3", "#eddea4", "#f2bf8b"])
@@ -101,8 +102,8 @@ def group_analysis(data, group):
     return fig
 
 
-def rev_by_loyalty_group(data):
-    revenue_by_loyalty = data.groupby('Loyalty Group')['Total Revenue_y'].sum().reset_index().rename(
+def rev_by_loyalty_group(cube, dates=None):
+    revenue_by_loyalty = cube.rollup(['Loyalty Group'], dates=dates)['Total Revenue_y'].reset_index().rename(
         {"Total Revenue_y": "Contribution"}, axis=1
     )
     fig = px.pie(
@@ -119,15 +120,13 @@ def rev_by_loyalty_group(data):
     return fig
 
 
-def cltv_by_month(data):
-    data["Month"] = data["Valuation Date"].dt.month
-    avg_cltv_by_month = data.groupby(
-        'Month')['CLTV Monetary Value'].mean().reset_index()
-    avg_cltv_by_month["Month"] = avg_cltv_by_month["Month"].apply(
-        lambda x: MONTHS[x - 1])
+def cltv_by_month(cube, dates=None):
+    monthly = cube.rollup(PERIOD_KEYS, dates=dates)
+    avg_cltv_by_month = (monthly['CLTV Monetary Value'] /
+                         monthly[count_column('CLTV Monetary Value')]).rename('CLTV Monetary Value').reset_index()
     fig = go.Figure(
         go.Bar(
-            x=avg_cltv_by_month["Month"],
+            x=month_axis(avg_cltv_by_month["Year"], avg_cltv_by_month["Month"]),
             y=avg_cltv_by_month["CLTV Monetary Value"],
             marker=dict(color="#2a9d8f"),
             text=round(avg_cltv_by_month["CLTV Monetary Value"], 2),
@@ -142,44 +141,29 @@ def cltv_by_month(data):
     return fig
 
 
-def conversion_and_purchase_rates(data):
-    data["Month"] = data["Valuation Date"].dt.month
-    con_rate = data.groupby('Month')['Customer_ID'].nunique().reset_index()
-    conversion = data['Month'].value_counts().reset_index()
-    conversion.rename(
-        columns={"index": "Month", "Month": "num_conversion"}, inplace=True)
-    con_rate = pd.merge(con_rate, conversion, on="Month")
-    con_rate["conversion_rate"] = (
-        con_rate["Customer_ID"] / con_rate["num_conversion"]) * 100
-    con_rate.sort_values(by="Month", inplace=True)
-    con_rate["Month"] = con_rate["Month"].apply(lambda x: MONTHS[x - 1])
+def conversion_and_purchase_rates(cube, dates=None):
+    monthly = cube.rollup(PERIOD_KEYS, dates=dates)
+    months = month_axis(monthly.index.get_level_values("Year"), monthly.index.get_level_values("Month"))
+    # Distinct customers per transaction in each month
+    con_rate = (monthly[CUSTOMERS] / monthly[ROWS] * 100).rename("conversion_rate").reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
-        x=con_rate['Month'],
+        x=months,
         y=con_rate['conversion_rate'],
         name='Conversion Rate', marker=dict(color="#006d77"),
         text=con_rate['conversion_rate'].apply(
             lambda rate: f"{round(rate, 2)}%"),
     ))
 
-    purchase_counts = data.groupby(
-        ['Customer_ID', 'Month']).size().reset_index(name='purchase_count')
-    purchase_counts = purchase_counts[purchase_counts['purchase_count'] > 1]
-
-    total_customers = purchase_counts.groupby(
-        'Month')['Customer_ID'].nunique().reset_index()
-    purchase_counts = purchase_counts.groupby(
-        "Month")["purchase_count"].sum().reset_index()
-    repeat_purchase = pd.merge(purchase_counts, total_customers, on="Month")
-    repeat_purchase["repeat_purchase_rate"] = (repeat_purchase["Customer_ID"] / repeat_purchase[
-        "purchase_count"]) * 100
-    repeat_purchase.sort_values(by="Month", inplace=True)
-    repeat_purchase["Month"] = repeat_purchase["Month"].apply(
-        lambda x: MONTHS[x-1])
+    # Customers buying more than once in a month, per purchase they made
+    repeating = (monthly[REPEAT_CUSTOMERS] > 0).to_numpy()
+    repeat_purchase = monthly[repeating]
+    repeat_purchase = (repeat_purchase[REPEAT_CUSTOMERS] / repeat_purchase[REPEAT_PURCHASES] * 100).rename(
+        "repeat_purchase_rate").reset_index()
 
     fig.add_trace(go.Bar(
-        x=repeat_purchase["Month"],
+        x=months[repeating],
         y=repeat_purchase["repeat_purchase_rate"],
         text=repeat_purchase['repeat_purchase_rate'].apply(
             lambda rate: f"{round(rate, 2)}%"),
@@ -2,69 +2,50 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from constants import MONTHS
+from store.cube import count_column
+from store.elasticity import CI_LOWER, CI_UPPER, ELASTICITY
 
 # Color palette for consistency
 COLORS = ["#2a9d8f", "#264653", "#e9c46a", "#f4a261", "#e76f51", "#ef233c", "#f6bd60", "#84a59d", "#f95738"]
 
-def prepare_data(data):
-    """Prepare data for demand elasticity analysis"""
-    # Make a copy to avoid SettingWithCopyWarning
-    df = data.copy()
-    
-    # Check if we have a date column or need to create one
-    if 'Date' not in df.columns:
-        # Print available columns for debugging
-        print("Available columns:", df.columns.tolist())
-        
-        # Try different date column possibilities
-        if 'Created Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Created Date'])
-        elif 'Transaction_Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Transaction_Date'])
-        elif 'Order Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Order Date'])
-        else:
-            # If no date column found, create a dummy date for testing
-            print("Warning: No date column found, using index as date")
-            df['Date'] = pd.date_range(start='2023-01-01', periods=len(df), freq='D')
-    
-    # Extract year and month
-    df['Year'] = df['Date'].dt.year
-    df['Month'] = df['Date'].dt.month
-    
-    return df
+def _mean(cells, measure):
+    """Mean of an averaged measure over rolled-up cube cells"""
+    return cells[measure] / cells[count_column(measure)]
+
 
-def price_elasticity_overtime(data):
-    """Calculate and visualize price elasticity over time"""
+def price_elasticity_overtime(estimates):
+    """Visualize the estimated price elasticity of each product over time"""
     try:
-        df = prepare_data(data)
-        
-        # Group and calculate mean elasticity
-        yearly_elasticity = df.groupby(["Year", "Product"])["Price Elasticity"].mean().reset_index()
+        # Log-log fits per Product × Year, see store.elasticity
+        yearly_elasticity = estimates.reset_index()
         
         fig = go.Figure()
         
-        # Create bars for each product
+        # Create bars for each product, with their confidence interval
         for idx, prod in enumerate(yearly_elasticity['Product'].unique()):
             prod_data = yearly_elasticity[yearly_elasticity["Product"] == prod]
             
             fig.add_trace(
                 go.Bar(
                     y=prod_data["Year"].astype(str),
-                    x=prod_data["Price Elasticity"],
+                    x=prod_data[ELASTICITY],
                     name=prod,
                     marker=dict(color=COLORS[idx % len(COLORS)]),
                     orientation="h",
+                    error_x=dict(type="data", symmetric=False,
+                                 array=prod_data[CI_UPPER] - prod_data[ELASTICITY],
+                                 arrayminus=prod_data[ELASTICITY] - prod_data[CI_LOWER]),
+                    customdata=prod_data[[CI_LOWER, CI_UPPER]],
                     hovertemplate="Year: %{y}<br>" +
                                 "Elasticity: %{x:.2f}<br>" +
+                                "95% CI: %{customdata[0]:.2f} to %{customdata[1]:.2f}<br>" +
                                 "<extra></extra>"
                 )
             )
         
         # Update layout
         fig.update_layout(
-            title="Average Price Elasticity By Year",
+            title="Estimated Price Elasticity By Year",
             xaxis_title="Price Elasticity",
             yaxis_title="Year",
             showlegend=True,
@@ -88,10 +69,8 @@ def price_elasticity_overtime(data):
 def elasticity_vs_base_price(data):
     """Create scatter plot of elasticity vs base price"""
     try:
-        df = prepare_data(data)
-        
         fig = px.scatter(
-            df,
+            data,
             x="Base Price",
             y="Price Elasticity",
             color="Product",
@@ -118,13 +97,11 @@ def elasticity_vs_base_price(data):
             showarrow=False
         )
 
-def sales_volume_overtime(data):
+def sales_volume_overtime(cube):
     """Analyze sales volume trends over time"""
     try:
-        df = prepare_data(data)
-        
         # Calculate yearly sales by product
-        yearly_sales = df.groupby(["Year", "Product"])["Units Sold"].sum().reset_index()
+        yearly_sales = cube.rollup(["Year", "Product"])["Units Sold"].reset_index()
         yearly_sales = yearly_sales.sort_values(by="Year", ascending=True)
         
         # Calculate price sensitivity
@@ -185,15 +162,14 @@ def sales_volume_overtime(data):
             showarrow=False
         )
 
-def price_and_qty_overtime(data):
+def price_and_qty_overtime(cube):
     """Analyze price and quantity relationships over time"""
     try:
-        df = prepare_data(data)
-        
         # Monthly aggregation
-        monthly_data = df.groupby(["Month", "Year"]).agg({
-            "Base Price": "mean",
-            "Units Sold": "sum"
+        cells = cube.rollup(["Year", "Month"])
+        monthly_data = pd.DataFrame({
+            "Base Price": _mean(cells, "Base Price"),
+            "Units Sold": cells["Units Sold"]
         }).reset_index()
         
         fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -201,8 +177,6 @@ def price_and_qty_overtime(data):
         # Add traces for each year
         for idx, year in enumerate(sorted(monthly_data["Year"].unique())):
             year_data = monthly_data[monthly_data["Year"] == year].copy()
-            year_data.sort_values(by="Month", inplace=True)
-            year_data["Month"] = year_data["Month"].apply(lambda x: MONTHS[x - 1])
             
             # Add base price bars
             fig.add_trace(
@@ -252,11 +226,11 @@ def price_and_qty_overtime(data):
 def shipping_vs_tax_ratio(data):
     """Analyze the relationship between shipping/tax ratio and other metrics"""
     try:
-        df = prepare_data(data)
+        df = data
         
-        # Calculate shipping and tax ratio if not present
+        # Calculate shipping and tax ratio if not present, on a copy of the shared frame
         if 'Shipping and Tax Ratio' not in df.columns and 'Shipping' in df.columns and 'Tax' in df.columns:
-            df['Shipping and Tax Ratio'] = (df['Shipping'] + df['Tax']) / df['Base Price']
+            df = df.assign(**{'Shipping and Tax Ratio': (df['Shipping'] + df['Tax']) / df['Base Price']})
         
         # Create scatter plot
         fig = px.scatter(
@@ -0,0 +1,91 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from constants import MAX_TRACE_POINTS, WEBGL_TRACE_POINTS
+
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, budget: int) -> np.ndarray:
+    """
+    Positions of the points kept by min/max bucketing: the points are split into
+    budget // 2 buckets of consecutive x and each bucket keeps its lowest and
+    highest y, so spikes survive; the first and last point are always kept
+    :param x: numeric x of each point, ascending
+    :param y: y of each point
+    :param budget: maximum number of points to keep, besides the first and last one
+    :return: sorted positions of the kept points
+    """
+    n = len(y)
+    n_buckets = max(budget // 2, 1)
+    if n <= budget:
+        return np.arange(n)
+    # Buckets of equal x width, so the shape of unevenly spaced series is kept
+    span = x[-1] - x[0]
+    bucket = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1) if span > 0 \
+        else np.arange(n) * n_buckets // n
+    # Sorted by bucket then y, missing values last: the first and last position of a bucket are its min and max
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.diff(bucket[order], prepend=-1))
+    stops = np.append(starts[1:], n) - 1
+    last_valid = stops.copy()
+    missing = np.isnan(y[order])
+    if missing.any():
+        # The highest value of a bucket rather than its missing ones
+        valid_before = np.maximum.accumulate(np.where(missing, -1, np.arange(n)))
+        last_valid = np.maximum(valid_before[stops], starts)
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[last_valid]]))
+
+
+def _numeric(values) -> np.ndarray:
+    """
+    x values as numbers, datetimes as int64 nanoseconds; None for other values
+    such as categories, which cannot be bucketed
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64)
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64)
+    if values.dtype.kind == "O" and len(values) and isinstance(values[0], (datetime.date, np.datetime64, str)):
+        try:
+            return pd.to_datetime(values).to_numpy("datetime64[ns]").astype(np.int64)
+        except (ValueError, TypeError):
+            return None
+    return None
+
+
+def _webgl(trace) -> bool:
+    # Scattergl draws lines and markers, not text or smoothed lines
+    return "text" not in (trace.mode or "") and (trace.line.shape or "linear") in ("linear", "hv", "vh", "hvh", "vhv")
+
+
+def downsample(fig: go.Figure, budget: int = MAX_TRACE_POINTS, webgl_points: int = WEBGL_TRACE_POINTS) -> go.Figure:
+    """
+    Caps the points sent to the browser: Scatter traces with more than budget points
+    and a numeric or date x ascending are reduced by min/max bucketing, and traces still
+    above webgl_points are drawn with WebGL (Scattergl)
+    :param fig: the figure, changed in place unless a trace is converted to WebGL
+    :param budget: maximum points per trace
+    :param webgl_points: points from which a trace is drawn with WebGL
+    :return: the figure with the reduced traces
+    """
+    converted = False
+    traces = []
+    for trace in fig.data:
+        if trace.type == "scatter" and trace.y is not None and len(trace.y) > budget and trace.x is not None:
+            x = _numeric(trace.x)
+            if x is not None and len(x) == len(trace.y) and (np.diff(x) >= 0).all():
+                keep = minmax_indices(x, np.asarray(trace.y, dtype=np.float64), budget)
+                trace.update(x=np.asarray(trace.x)[keep], y=np.asarray(trace.y)[keep])
+                # Per-point values follow their points
+                for name in ("text", "hovertext", "customdata"):
+                    values = trace[name]
+                    if values is not None and not isinstance(values, str) and len(values) == len(x):
+                        trace[name] = np.asarray(values)[keep]
+        if trace.type == "scatter" and trace.y is not None and len(trace.y) > webgl_points and _webgl(trace):
+            trace = go.Scattergl(trace.to_plotly_json(), skip_invalid=True)
+            converted = True
+        traces.append(trace)
+    return go.Figure(data=traces, layout=fig.layout) if converted else fig
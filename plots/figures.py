@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from constants import FIGURE_CACHE_ENTRIES, FIGURE_CACHE_MB
+from plots.downsample import downsample
+from store.dataset import data_version
+
+
+class FigureCache:
+    """
+    Process-wide LRU cache of serialized figures, shared by every session.
+    A figure is keyed by its chart, the filter values it was drawn for and the
+    data versions of the Dataset objects it was drawn from, so switching back
+    to a page or re-selecting a filter skips both the pandas work and the
+    figure build. Built figures go through plots.downsample before they are
+    cached, and cached ones are rebuilt from their JSON without plotly's
+    validation, which they already passed once.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        """
+        :param max_bytes: cap on the summed size of the serialized figures
+        :param max_entries: cap on the number of cached charts
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, name: str, data: tuple, filters: tuple, build):
+        """
+        The figure(s) of a chart, built on a miss
+        :param name: name of the chart
+        :param data: the Dataset objects the chart reads, as taken from the Dataset
+        :param filters: hashable filter values the chart depends on besides the data
+        :param build: callable without arguments returning a Figure or a tuple of Figures
+        :return: what build returns; built again on every call when an object in data has no version
+        """
+        versions = tuple(data_version(obj) for obj in data)
+        if None in versions:
+            return build()
+        key = (name, filters, versions)
+        with self._lock:
+            specs = self._entries.get(key)
+            if specs is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if specs is not None:
+            return tuple(map(_figure, specs)) if isinstance(specs, tuple) else _figure(specs)
+        figures = build()
+        figures = tuple(map(downsample, figures)) if isinstance(figures, tuple) else downsample(figures)
+        specs = tuple(pio.to_json(figure, validate=False) for figure in figures) \
+            if isinstance(figures, tuple) else pio.to_json(figures, validate=False)
+        self._put(key, specs)
+        return figures
+
+    def _put(self, key, specs):
+        size = sum(map(len, specs)) if isinstance(specs, tuple) else len(specs)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = specs
+            self.size += size
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sum(map(len, evicted)) if isinstance(evicted, tuple) else len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def _figure(spec: str) -> go.Figure:
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+FIGURES = FigureCache(max_bytes=FIGURE_CACHE_MB * 2 ** 20, max_entries=FIGURE_CACHE_ENTRIES)
+
+
+def cached_chart(chart, *data, filters: tuple = ()):
+    """
+    Draws a chart through FIGURES
+    :param chart: chart function, called as chart(*data, *filters) on a miss
+    :param data: Dataset objects the chart reads
+    :param filters: filter values passed after the data
+    :return: the chart's figure(s)
+    """
+    return FIGURES.get(f"{chart.__module__}.{chart.__qualname__}", data, filters,
+                       lambda: chart(*data, *filters))
@@ -1,6 +1,19 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from constants import MONTHS
+from plots.downsample import downsample
+from store.schema import MONTH_DTYPE, month_axis
+
+DAY_NS = 86_400_000_000_000
+
+# Overview KPIs in display order: metric -> indicator_chart options
+OVERVIEW_KPIS = {
+    "customers": {"label": "Number of Customers", "trace_name": "# Customers"},
+    "clv": {"label": "Customer Lifetime Value", "prefix": "₹", "trace_name": "CLV"},
+    "lifespan": {"label": "Average Life Span", "suffix": " days", "trace_name": "Avg. Lifespan"},
+    "arpu": {"label": "Average ARPU", "prefix": "₹", "trace_name": "Total Revenue"},
+    "churn": {"label": "Churn Rate", "suffix": "%", "trace_name": "churn"},
+}
 
 
 def indicator_chart(label, current_value, delta_value, y_data, trace_name,
@@ -53,7 +66,152 @@ def indicator_chart(label, current_value, delta_value, y_data, trace_name,
                           bgcolor="white", font_color="black", font_size=16, font_family="Rockwell")
                       )
 
-    return fig
+    # Sparklines of daily or finer data keep a bounded number of points
+    return downsample(fig)
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.divide(numerator, denominator)
+
+
+def _months(dates: np.ndarray) -> tuple:
+    """
+    Months of the days, as year * 12 + month - 1 so that the same month of two years stays apart
+    :param dates: datetime64[ns] of each day, as int64, ascending
+    :return: tuple of (distinct month ids in order, position of each day's month in them)
+    """
+    days = pd.DatetimeIndex(dates)
+    return np.unique((days.year * 12 + days.month - 1).to_numpy(), return_inverse=True)
+
+
+def _month_labels(ids: np.ndarray):
+    # x values of a sparkline, as for the other monthly charts (utils.month_axis)
+    return month_axis(ids // 12, pd.Categorical.from_codes(ids % 12, dtype=MONTH_DTYPE))
+
+
+def _monthly(dates: np.ndarray, values: np.ndarray, how: str):
+    """
+    Monthly sparkline of a daily series
+    :param dates: datetime64[ns] of each day, as int64, ascending
+    :param values: value of each day
+    :param how: "sum" or "mean" of the days in a month
+    :return: tuple of (month labels, monthly values), for the months present in calendar order
+    """
+    ids, month = _months(dates)
+    days = np.bincount(month, minlength=len(ids))
+    totals = np.bincount(month, weights=values, minlength=len(ids))
+    return _month_labels(ids), totals if how == "sum" else totals / days
+
+
+def _amounts(values: pd.Series) -> np.ndarray:
+    # Blank amounts count as zero, as in a pandas sum
+    values = values.to_numpy("float64")
+    return np.nan_to_num(values) if np.isnan(values).any() else values
+
+
+def customer_lifespans(codes: np.ndarray, date_index: np.ndarray, dates: np.ndarray, n_codes: int):
+    """
+    Lifespan of every customer in whole days, the time between their first and
+    last purchase. Reduces the rows to one first and last date per customer,
+    so apart from the grouping itself it allocates per customer.
+
+    :param codes: customer code of each row
+    :param date_index: position of each row's date in dates
+    :param dates: distinct dates as int64 nanoseconds, ascending
+    :param n_codes: number of customer codes
+    :return: tuple of (lifespan per customer code, mask of the codes present in the rows)
+    """
+    bounds = pd.Series(date_index).groupby(codes, sort=False).agg(["min", "max"])
+    present = np.zeros(n_codes, dtype=bool)
+    present[bounds.index] = True
+    lifespan = np.zeros(n_codes)
+    lifespan[bounds.index] = (dates[bounds["max"]] - dates[bounds["min"]]) // DAY_NS
+    return lifespan, present
+
+
+def period_kpis(data: pd.DataFrame) -> dict:
+    """
+    Computes every overview KPI of one period and its monthly sparkline in one
+    pass over the rows: dates are factorized once, then every measure is a
+    bincount per date or per customer code.
+
+    :param data: DataFrame with columns "Customer_ID", "Valuation Date",
+                 "CLTV Monetary Value", "Total Revenue_y" and the derived "Churn" flag.
+    :return: metric (keys of OVERVIEW_KPIS) -> {"value": number,
+             "months": month labels (utils.month_axis), "series": monthly values}
+    """
+    if data["Valuation Date"].hasnans:
+        data = data[data["Valuation Date"].notna()]
+    customers = data["Customer_ID"]
+    codes = customers.cat.codes.to_numpy() if isinstance(customers.dtype, pd.CategoricalDtype) \
+        else pd.factorize(customers)[0]
+    n_codes = int(codes.max()) + 1 if len(codes) else 1
+    date_index, dates = pd.factorize(data["Valuation Date"].to_numpy("datetime64[ns]").view("int64"), sort=True)
+    n_dates = len(dates)
+    cltv = _amounts(data["CLTV Monetary Value"])
+    revenue = _amounts(data["Total Revenue_y"])
+    churned = data["Churn"].to_numpy().astype(bool)
+
+    # Per customer
+    lifespan, present = customer_lifespans(codes, date_index, dates, n_codes)
+    customer_cltv = np.bincount(codes, weights=cltv, minlength=n_codes)[present]
+    n_customers = int(present.sum())
+
+    # Per date; distinct customers per date come from the distinct (date, customer) pairs
+    pairs = pd.unique(date_index * n_codes + codes)
+    date_customers = np.bincount(pairs // n_codes, minlength=n_dates)
+    date_rows = np.bincount(date_index, minlength=n_dates)
+    date_revenue = np.bincount(date_index, weights=revenue, minlength=n_dates)
+    # Per month; summing the distinct customers of each day would count a customer once per day
+    month_ids, date_month = _months(dates)
+    month_index = date_month[date_index]
+    month_customers = np.bincount(pd.unique(month_index * n_codes + codes) // n_codes, minlength=len(month_ids))
+
+    values = {
+        "customers": n_customers,
+        "clv": customer_cltv.mean() if n_customers else np.nan,
+        "lifespan": lifespan[present].mean() if n_customers else np.nan,
+        "arpu": _ratio(revenue.sum(), n_customers),
+        "churn": _ratio(churned.sum(), len(churned)) * 100,
+    }
+    daily = {
+        "clv": (np.bincount(date_index, weights=cltv, minlength=n_dates), "mean"),
+        # Row-weighted, as if each transaction carried its customer's lifespan
+        "lifespan": (_ratio(np.bincount(date_index, weights=lifespan[codes], minlength=n_dates), date_rows),
+                     "mean"),
+        "arpu": (_ratio(date_revenue, date_customers), "mean"),
+        "churn": (np.bincount(date_index[churned], minlength=n_dates), "mean"),
+    }
+    kpis = {"customers": {"value": values["customers"], "months": _month_labels(month_ids),
+                          "series": month_customers}}
+    for metric, (series, how) in daily.items():
+        months, monthly = _monthly(dates, series, how)
+        kpis[metric] = {"value": values[metric], "months": months, "series": monthly}
+    return kpis
+
+
+def overview_kpis(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> dict:
+    """
+    Every overview KPI for the current and the previous period
+
+    :return: {"current": period_kpis(current_data), "previous": period_kpis(previous_data)}
+    """
+    return {"current": period_kpis(current_data), "previous": period_kpis(previous_data)}
+
+
+def kpi_chart(metric: str, kpis: dict) -> go.Figure:
+    """
+    Renders one overview KPI as an indicator chart: the current value, its delta
+    to the previous period and the current monthly sparkline.
+
+    :param metric: one of the keys of OVERVIEW_KPIS
+    :param kpis: output of overview_kpis
+    :return: A Plotly Figure object containing the indicator chart.
+    """
+    current, previous = kpis["current"][metric], kpis["previous"][metric]
+    return indicator_chart(current_value=current["value"], delta_value=previous["value"],
+                           x_data=current["months"], y_data=current["series"], **OVERVIEW_KPIS[metric])
 
 
 def get_num_of_customers(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Figure:
@@ -66,24 +224,7 @@ def get_num_of_customers(current_data: pd.DataFrame, previous_data: pd.DataFrame
                           with columns "Customer_ID".
     :return: A Plotly Figure object containing the indicator chart.
     """
-
-    # Number of unique customers in the current data(period)
-    current_value = current_data["Customer_ID"].nunique()
-    # Number of unique customers in the previous data(period)
-    previous_value = previous_data["Customer_ID"].nunique()
-    # getting unique customer count for current period
-    y_data = current_data.groupby("Valuation Date")[
-        "Customer_ID"].nunique().reset_index()
-    # extracting month
-    y_data['Month'] = y_data['Valuation Date'].dt.month
-    # aggregating by month to get total number of customers in given month
-    y_data = y_data.groupby("Month")["Customer_ID"].sum().reset_index()
-    # converting month number to name
-    y_data['Month'] = y_data['Month'].apply(lambda x: MONTHS[x - 1])
-    # indicator chart with scatter-line chart in bg for monthly trend
-    fig = indicator_chart(label="Number of Customers", current_value=current_value, delta_value=previous_value,
-                          x_data=y_data["Month"], y_data=y_data["Customer_ID"], trace_name="# Customers")
-    return fig
+    return kpi_chart("customers", overview_kpis(current_data, previous_data))
 
 
 def get_clv(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Figure:
@@ -96,31 +237,7 @@ def get_clv(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Figur
                           with columns "Customer_ID" and "Valuation Date" & "CLTV Monetary Value".
     :return: A Plotly Figure object containing the indicator chart.
     """
-    # Calculating the total monetary value generated by each customer.
-    current = current_data.groupby(['Customer_ID'])[
-        'CLTV Monetary Value'].sum()
-    # Averaging it across the data
-    current = current.mean()
-    # monetary value of each customer in previous period/data (for reference purpose)
-    previous = previous_data.groupby(['Customer_ID'])[
-        'CLTV Monetary Value'].sum()
-    # averaging the CLTV Monetary value of previous period
-    previous = previous.mean()
-    # Aggregating the CLTV monetary value of customers' w.r.t Date
-    y_data = current_data.groupby("Valuation Date")[
-        "CLTV Monetary Value"].sum().reset_index()
-    # Adding Month
-    y_data['Month'] = y_data['Valuation Date'].dt.month
-    # Getting monthly trend
-    y_data = y_data.groupby(
-        "Month")["CLTV Monetary Value"].mean().reset_index()
-    y_data['Month'] = y_data['Month'].apply(lambda x: MONTHS[x - 1])
-    # indicator chart with CLTV Monetary Value for current period and monthly trend in the bg
-    fig = indicator_chart(label="Customer Lifetime Value", current_value=current, delta_value=previous,
-                          x_data=y_data["Month"], y_data=y_data["CLTV Monetary Value"],
-                          prefix="₹", trace_name="CLV"
-                          )
-    return fig
+    return kpi_chart("clv", overview_kpis(current_data, previous_data))
 
 
 def average_life_span(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Figure:
@@ -133,41 +250,7 @@ def average_life_span(current_data: pd.DataFrame, previous_data: pd.DataFrame) -
                           with columns "Customer_ID" and "Valuation Date"
     :return: A Plotly Figure object containing the indicator chart.
     """
-    # Calculating the first and last day(Active) for a Customer
-    cust_lsp_current = current_data.groupby(
-        'Customer_ID')['Valuation Date'].agg(['min', 'max']).reset_index()
-    # lifespan of each customer as the difference between the first and last active date
-    cust_lsp_current['lifespan'] = cust_lsp_current['max'] - \
-        cust_lsp_current['min']
-    # lifespan as the number of days
-    cust_lsp_current['lifespan'] = cust_lsp_current['lifespan'].apply(
-        lambda x: x.days)
-    # Calculate the average lifespan of the customers for current period
-    avg_lsp_current = cust_lsp_current['lifespan'].mean()
-    # Calculating the lifespan of customers for previous period
-    cust_lsp_prev = previous_data.groupby('Customer_ID')['Valuation Date'].agg([
-        'min', 'max']).reset_index()
-    cust_lsp_prev['lifespan'] = cust_lsp_prev['max'] - cust_lsp_prev['min']
-    cust_lsp_prev['lifespan'] = cust_lsp_prev['lifespan'].apply(
-        lambda x: x.days)
-    # average lifespan of the customers for previous period
-    avg_lsp_prev = cust_lsp_prev['lifespan'].mean()
-    # Merging the customer lifespan data with the current period data on 'Customer_ID'
-    cust_lsp_current = cust_lsp_current.merge(current_data, on="Customer_ID")
-    # Aggregating by 'Valuation Date' and calculating the average lifespan for each date
-    y_data = cust_lsp_current.groupby("Valuation Date")[
-        "lifespan"].mean().reset_index()
-    # Extracting the month from the 'Valuation Date'
-    y_data["Month"] = y_data["Valuation Date"].dt.month
-    # Grouping by month and calculate the average lifespan for each month
-    y_data = y_data.groupby("Month")["lifespan"].mean().reset_index()
-    # Month numbers to month names using the MONTHS list
-    y_data['Month'] = y_data['Month'].apply(lambda x: MONTHS[x - 1])
-    # indicator chart with the average lifespan data
-    fig = indicator_chart(label="Average Life Span", current_value=avg_lsp_current, delta_value=avg_lsp_prev,
-                          x_data=y_data["Month"], y_data=y_data["lifespan"], suffix=" days",
-                          trace_name="Avg. Lifespan")
-    return fig
+    return kpi_chart("lifespan", overview_kpis(current_data, previous_data))
 
 
 def average_arpu(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Figure:
@@ -180,30 +263,7 @@ def average_arpu(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.
                           with columns "Customer_ID" and "Valuation Date" & "Total Revenue".
     :return: A Plotly Figure object containing the indicator chart.
     """
-    print("Available columns:", current_data.columns.tolist())
-    # Calculating the current period's Average Revenue Per User (ARPU)
-    current_arpu = current_data["Total Revenue_y"].sum(
-    ) / current_data['Customer_ID'].nunique()
-    # Calculating the previous period's Average Revenue Per User (ARPU)
-    previous_arpu = previous_data["Total Revenue_y"].sum(
-    ) / previous_data['Customer_ID'].nunique()
-    # Grouping by 'Valuation Date' for 'Total Revenue_y' and the number of unique 'Customer_ID'
-    arpu_data = current_data.groupby("Valuation Date").agg(
-        {'Total Revenue_y': 'sum', 'Customer_ID': 'nunique'}
-    ).reset_index()
-    # ARPU for each 'Valuation Date'
-    arpu_data["arpu"] = arpu_data["Total Revenue_y"] / arpu_data["Customer_ID"]
-    # Month from the 'Valuation Date'
-    arpu_data["Month"] = arpu_data["Valuation Date"].dt.month
-    # Grouping by month to get monthly trend for ARPU
-    arpu_data = arpu_data.groupby("Month")["arpu"].mean().reset_index()
-    # Month numbers to month names using the MONTHS list
-    arpu_data['Month'] = arpu_data['Month'].apply(lambda x: MONTHS[x - 1])
-    # indicator chart with the ARPU data
-    fig = indicator_chart(label="Average ARPU", current_value=current_arpu, delta_value=previous_arpu,
-                          x_data=arpu_data["Month"], y_data=arpu_data["arpu"], prefix="₹",
-                          trace_name="Total Revenue")
-    return fig
+    return kpi_chart("arpu", overview_kpis(current_data, previous_data))
 
 
 def churn_rate(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Figure:
@@ -211,33 +271,9 @@ def churn_rate(current_data: pd.DataFrame, previous_data: pd.DataFrame) -> go.Fi
     Generates a Plotly indicator chart showing the customers' churn rate.
 
     :param current_data: DataFrame containing the current customer data.
-                         with columns "Customer_ID", "Valuation Date", and "P notAlive".
+                         with columns "Customer_ID", "Valuation Date", and "Churn".
     :param previous_data: DataFrame containing the previous customer data.
-                          with columns "Customer_ID", "Valuation Date", and "P notAlive".
+                          with columns "Customer_ID", "Valuation Date", and "Churn".
     :return: A Plotly Figure object containing the indicator chart.
     """
-    # Churn status for current period based on 'P notAlive' probability
-    current_data["churn"] = current_data["P notAlive"].apply(
-        lambda x: 1 if x > 0.5 else 0)
-    # Churn status for previous period
-    previous_data["churn"] = previous_data["P notAlive"].apply(
-        lambda x: 1 if x > 0.5 else 0)
-    # Average churn rate for the current period
-    current_churn = current_data["churn"].mean()
-    # Average churn rate for the previous period
-    previous_churn = previous_data["churn"].mean()
-    # Calculating the total churn for each date
-    churn_data = current_data.groupby("Valuation Date")[
-        "churn"].sum().reset_index()
-    # Extracting the month from the 'Valuation Date'
-    churn_data["Month"] = churn_data["Valuation Date"].dt.month
-    # Average churn rate for each month
-    churn_data = churn_data.groupby("Month")["churn"].mean().reset_index()
-    # Month numbers to month names using the MONTHS list
-    churn_data['Month'] = churn_data['Month'].apply(lambda x: MONTHS[x - 1])
-    # Indicator chart with the churn rate data
-    fig = indicator_chart(label="Churn Rate", current_value=current_churn * 100,
-                          delta_value=previous_churn * 100, suffix="%",
-                          x_data=churn_data["Month"], y_data=churn_data["churn"],
-                          trace_name="churn")
-    return fig
+    return kpi_chart("churn", overview_kpis(current_data, previous_data))
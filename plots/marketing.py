@@ -3,11 +3,13 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from utils import update_hover_layout
-from constants import MONTHS
+from store.attribution import MODELS
+from store.funnel import ALL, FUNNELS, WEEK, conversion_rates as funnel_conversion_rates
 
 
-def event_seq_pie(data):
-    fig = px.pie(data, names='Event Sequence', values='AOV',
+def event_seq_pie(cube, dates=None):
+    aov_by_step = cube.rollup(['Event Sequence'], dates=dates)['AOV'].reset_index()
+    fig = px.pie(aov_by_step, names='Event Sequence', values='AOV',
                  labels="percent+label", hole=0.3,
                  color_discrete_sequence=["#0fa3b1", "#b5e2fa", "#eddea4", "#f7a072", "#f9f7f3",
                                           "teal", "silver", "#f2cc8f", "#81b29a"],
@@ -17,32 +19,34 @@ def event_seq_pie(data):
     return fig
 
 
-def event_seq_funnel(data):
-    total_visitors = len(data)
-    event_sequence_steps = [1, 2, 3, 4, 5, 6, 7]
-    conversion_rates = []
-    previous_count = total_visitors
-    for step in event_sequence_steps:
-        current_count = len(data[data['Event Sequence'] == step])
-        conversion_rate = (current_count / previous_count) * 100
-        conversion_rates.append(conversion_rate)
-        previous_count = current_count
-    fig = go.Figure(go.Funnel(
-        y=event_sequence_steps,
-        x=conversion_rates,
-        textinfo="value+percent initial",
-        marker={"color": ["deepskyblue", "lightsalmon", "tan", "teal", "silver", "#f2cc8f", "#81b29a"]},
-    ))
+def event_seq_funnel(funnel_counts, dates=None, funnel="Event Sequence"):
+    start, end = dates if dates is not None else (None, None)
+    definition = FUNNELS[funnel]
+    conversion_rates = funnel_conversion_rates(funnel_counts.counts(definition, start, end))
+    event_sequence_steps = list(definition.stages)
+    fig = go.Figure()
+    for group, rates in conversion_rates.iterrows():
+        fig.add_trace(go.Funnel(
+            y=event_sequence_steps,
+            x=rates.tolist(),
+            textinfo="value+percent initial",
+            # One color per step for a single funnel, one per group otherwise
+            marker={"color": ["deepskyblue", "lightsalmon", "tan", "teal", "silver", "#f2cc8f", "#81b29a"]}
+            if definition.by is None else None,
+            name=None if definition.by is None else str(group.date() if definition.by == WEEK else group),
+        ))
     fig.update_layout(title="Event Sequence Conversion Funnel",
                       xaxis_title="Conversion Rate (%)",
                       yaxis_title="Event Sequence Step",
-                      showlegend=False, height=500)
+                      showlegend=definition.by is not None, height=500)
     return fig
 
 
-def channel_funnel(df1, df2):
-    total_spend = df1.groupby('Channel')['Media Spend'].sum()
-    total_conversions = df2[df2['Is Target'] == 1].groupby('Channel')['Is Target'].count()
+def channel_funnel(media_daily, funnel_counts, dates=None):
+    start, end = dates if dates is not None else (None, None)
+    total_spend = media_daily.totals(start, end)['Media Spend']
+    # Converting events per channel, at any step
+    total_conversions = funnel_counts.counts(FUNNELS["Conversions by Channel"], start, end)[ALL]
     percent_spend = (total_spend / total_spend.sum()) * 100
     percent_conversion = (total_conversions / total_conversions.sum()) * 100
 
@@ -56,11 +60,10 @@ def channel_funnel(df1, df2):
     return fig
 
 
-def channels_performance(data):
-    channel_conversion_rates = data[data['Is Target'] == 1].groupby(
-        'Channel'
-    )['Is Target'].count()
-    top_channel = channel_conversion_rates.idxmax()
+def channels_performance(cube, dates=None):
+    channel_conversion_rates = cube.rollup(['Channel'], dates=dates)['Is Target']
+    # No highlight for a range without market data
+    top_channel = None if channel_conversion_rates.empty else channel_conversion_rates.idxmax()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(x=channel_conversion_rates.index, y=channel_conversion_rates))
@@ -78,11 +81,41 @@ def channels_performance(data):
     return fig
 
 
-def aov_by_channels(data):
-    fig = px.pie(data, names='Channel', values='AOV',
+def aov_by_channels(cube, dates=None):
+    aov_by_channel = cube.rollup(['Channel'], dates=dates)['AOV'].reset_index()
+    fig = px.pie(aov_by_channel, names='Channel', values='AOV',
                  labels="percent+label", hole=0.3,
                  color_discrete_sequence=["#0fa3b1", "#b5e2fa", "#eddea4", "#f7a072",
                                           "teal", "silver", "#f2cc8f", "#81b29a"],
                  title='Average Order Value (AOV) by Channel')
     fig = update_hover_layout(fig)
     return fig
+
+
+def attribution_by_channel(journeys, dates=None):
+    start, end = dates if dates is not None else (None, None)
+    credit = journeys.credit(start, end)
+    fig = go.Figure()
+    for model, color in zip(MODELS, ["#264653", "#2a9d8f", "#e9c46a", "#f4a261", "#e76f51"]):
+        fig.add_trace(go.Bar(x=credit.index, y=credit[model], name=model, marker_color=color))
+    fig.update_layout(title="Conversions Attributed by Channel",
+                      xaxis_title="Channel",
+                      yaxis_title="Attributed Conversions",
+                      barmode="group",
+                      legend_title="Model",
+                      height=500)
+    fig = update_hover_layout(fig)
+    return fig
+
+
+def channel_removal_effects(journeys, dates=None):
+    start, end = dates if dates is not None else (None, None)
+    effects = journeys.removal_effects(start, end).sort_values(ascending=False) * 100
+    fig = go.Figure(go.Bar(x=effects.index, y=effects, marker=dict(color='#006d77')))
+    fig.update_layout(title="Markov Removal Effect by Channel",
+                      xaxis_title="Channel",
+                      yaxis_title="Conversions Lost Without the Channel (%)",
+                      showlegend=False,
+                      height=500)
+    fig = update_hover_layout(fig)
+    return fig
@@ -1,9 +1,9 @@
-import pandas as pd
+import numpy as np
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
-from constants import MONTHS
-from utils import update_hover_layout
+from store.cube import PERIOD_KEYS, count_column
+from utils import month_axis, update_hover_layout
 
 
 colors = ["#2a9d8f", "#264653", "#e9c46a", "#f4a261", "#e76f51", "#ef233c", "#f6bd60", "#84a59d", "#f95738"]
@@ -14,8 +14,9 @@ def income_statement(df):
                        'PayrollTax', 'OthExp']
     revenue_columns = ['Rev', 'ReturnAllow']
 
-    df["Total Expense"] = df[expense_columns].sum(axis=1)
-    df['Revenue'] = df[revenue_columns].sum(axis=1)
+    # cash_flow_data is shared between sessions, so derive columns on a new frame
+    df = df.assign(**{"Total Expense": df[expense_columns].sum(axis=1),
+                      "Revenue": df[revenue_columns].sum(axis=1)})
 
     fin_data = df.groupby("Year")['Total Expense', 'Profit or Loss', 'Revenue', 'CGS'].sum().reset_index()
     COLORS = ["#264653", "#2a9d8f", "#e9c46a", "#f4a261", "#e76f51"]
@@ -49,8 +50,8 @@ def debt_and_equity(df):
     debt_columns = ["AP", "AL", "TP", "WP", "NP", "Increase in TP", "Increase in WP"]
     shared_equity_columns = ["Stock", "Retained Earnings", "Distributable Earnings"]
 
-    df['Total Debt'] = df[debt_columns].sum(axis=1)
-    df['Shareholders Equity'] = df[shared_equity_columns].sum(axis=1)
+    df = df.assign(**{"Total Debt": df[debt_columns].sum(axis=1),
+                      "Shareholders Equity": df[shared_equity_columns].sum(axis=1)})
     df['Debt to Equity Ratio'] = df['Total Debt'] / df['Shareholders Equity']
 
     fin_data = df.groupby("Year")['Total Debt', 'Shareholders Equity', 'Debt to Equity Ratio'].sum().reset_index()
@@ -84,62 +85,30 @@ def debt_and_equity(df):
     return fig
 
 
-import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
-
-# Define months constant
-MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-
-def clv_by_cac_chart(df):
+def clv_by_cac_chart(cube, dates=None):
     """
     Create a bar chart showing the ratio of Customer Lifetime Value to Customer Acquisition Cost.
     
     Args:
-        df (pd.DataFrame): DataFrame containing 'CLTV Monetary Value', 'Discount', and 'Valuation Date' columns
+        cube (KpiCube): sales cube, holding the summed 'CLTV/CAC' ratios and their counts per month
+        dates (tuple): (start, end) days, the months they span are charted; every month by default
     
     Returns:
         plotly.graph_objects.Figure: Bar chart of CLV/CAC ratio
     """
     try:
-        # Create a copy to avoid modifying original dataframe
-        df_copy = df.copy()
-        
-        # Validate required columns
-        required_columns = ['CLTV Monetary Value', 'Discount', 'Valuation Date']
-        if not all(col in df_copy.columns for col in required_columns):
-            missing_cols = [col for col in required_columns if col not in df_copy.columns]
-            raise ValueError(f"Missing required columns: {missing_cols}")
-            
-        # Calculate ratio and handle division by zero
-        df_copy["ratio"] = df_copy["CLTV Monetary Value"].div(
-            df_copy["Discount"].replace(0, np.nan)
-        )
-        
-        # Extract month and convert to datetime if needed
-        if not pd.api.types.is_datetime64_any_dtype(df_copy['Valuation Date']):
-            df_copy['Valuation Date'] = pd.to_datetime(df_copy['Valuation Date'])
-        
-        df_copy['Month'] = df_copy['Valuation Date'].dt.month
-        
-        # Group by month and calculate mean ratio
-        monthly_ratios = (df_copy.groupby("Month")["ratio"]
-                         .mean()
-                         .round(2)
-                         .reset_index())
-        
-        # Convert month numbers to month names
-        monthly_ratios['Month'] = monthly_ratios['Month'].apply(lambda x: MONTHS[x-1])
-        
-        # Sort by month order
-        monthly_ratios['Month_Num'] = monthly_ratios['Month'].apply(lambda x: MONTHS.index(x))
-        monthly_ratios = monthly_ratios.sort_values('Month_Num')
+        # Mean ratio per month, transactions without a discount have no ratio
+        monthly = cube.rollup(PERIOD_KEYS, dates=dates)
+        monthly_ratios = (monthly["CLTV/CAC"]
+                          .div(monthly[count_column("CLTV/CAC")].replace(0, np.nan))
+                          .round(2)
+                          .rename("ratio")
+                          .reset_index())
         
         # Create the visualization
         fig = go.Figure(
             data=go.Bar(
-                x=monthly_ratios["Month"],
+                x=month_axis(monthly_ratios["Year"], monthly_ratios["Month"]),
                 y=monthly_ratios["ratio"],
                 marker=dict(
                     color="#006d77",
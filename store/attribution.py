@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from constants import ATTRIBUTION_HALF_LIFE_DAYS
+
+FIRST_TOUCH = "First Touch"
+LAST_TOUCH = "Last Touch"
+LINEAR = "Linear"
+TIME_DECAY = "Time Decay"
+MARKOV = "Markov"
+MODELS = [FIRST_TOUCH, LAST_TOUCH, LINEAR, TIME_DECAY, MARKOV]
+
+
+class Journeys:
+    """
+    The marketing event stream split into journeys once per data version, for
+    multi-touch attribution. market_data has no visitor id, so a journey is a
+    run of events in stream order whose Event Sequence keeps increasing; it
+    ends at a conversion (Is Target) or before an event that does not continue
+    the sequence. Each event is a touch of its channel.
+
+    Journeys are ordered by their last event, so the journeys ending in a range
+    of days are a slice of the touches, and attributing them costs a few
+    bincounts over that slice.
+    """
+
+    def __init__(self, dates: pd.Series, channels: pd.Series, steps: pd.Series, targets: pd.Series,
+                 half_life: float = ATTRIBUTION_HALF_LIFE_DAYS):
+        """
+        :param dates: datetime of each event; events without a date or channel are left out
+        :param channels: categorical channel of each event
+        :param steps: Event Sequence of each event, its step in the journey
+        :param targets: 1 for a converting event, 0 otherwise
+        :param half_life: days after which a touch gets half the time-decay credit of the converting one
+        """
+        self.channels = pd.CategoricalIndex(channels.cat.categories, dtype=channels.dtype, name=channels.name)
+        times = dates.to_numpy("datetime64[ns]")
+        codes = channels.cat.codes.to_numpy()
+        valid = ~np.isnat(times) & (codes >= 0)
+        times, codes = times[valid], codes[valid].astype(np.int64)
+        steps = steps.to_numpy()[valid]
+        targets = targets.to_numpy()[valid] > 0
+        if len(times) and not (np.diff(times.view(np.int64)) >= 0).all():
+            order = np.argsort(times, kind="stable")
+            times, codes, steps, targets = times[order], codes[order], steps[order], targets[order]
+        first = np.ones(len(times), dtype=bool)
+        first[1:] = (steps[1:] <= steps[:-1]) | targets[:-1]
+        starts = np.flatnonzero(first)
+        # Touch range of each journey, with a sentinel
+        self.bounds = np.append(starts, len(times))
+        lengths = np.diff(self.bounds)
+        self.journey = np.repeat(np.arange(len(starts)), lengths)
+        self.codes = codes
+        self.times = times
+        ends = self.bounds[1:] - 1
+        self.converted = targets[ends] if len(starts) else np.zeros(0, dtype=bool)
+        self.ends = times[ends]
+        # Per-touch shares of the linear and time-decay credit of their journey, independent of the range
+        self.linear = 1 / lengths[self.journey]
+        age = (self.ends[self.journey] - times) / np.timedelta64(1, "D")
+        decay = 0.5 ** (age / half_life)
+        self.decay = decay / np.bincount(self.journey, weights=decay, minlength=len(starts))[self.journey]
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def _slice(self, start, end) -> tuple:
+        """
+        Journeys ending from day start to day end, both included, and their touches
+        """
+        a, b = 0, len(self.ends)
+        if start is not None:
+            a = np.searchsorted(self.ends, np.datetime64(pd.Timestamp(start).normalize(), "ns"))
+        if end is not None:
+            stop = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+            b = max(a, np.searchsorted(self.ends, np.datetime64(stop, "ns")))
+        return a, b, self.bounds[a], self.bounds[b]
+
+    def _transitions(self, a: int, b: int, t0: int, t1: int) -> np.ndarray:
+        """
+        Transition counts between the states start, the channels, conversion and null
+        (no conversion), of the journeys a to b with touches t0 to t1
+        :return: (channels + 3) x (channels + 3) counts, the start state is last but two
+        """
+        n = len(self.channels)
+        start, conversion, null = n, n + 1, n + 2
+        codes, journey = self.codes[t0:t1], self.journey[t0:t1]
+        same = journey[1:] == journey[:-1]
+        origin = np.concatenate([np.full(b - a, start), codes[:-1][same], codes[self.bounds[a + 1:b + 1] - 1 - t0]])
+        target = np.concatenate([codes[self.bounds[a:b] - t0], codes[1:][same],
+                                 np.where(self.converted[a:b], conversion, null)])
+        return np.bincount(origin * (n + 3) + target, minlength=(n + 3) ** 2).reshape(n + 3, n + 3)
+
+    def removal_effects(self, start=None, end=None) -> pd.Series:
+        """
+        Removal effect of each channel in the first-order Markov chain of the journeys:
+        the share of the conversion probability lost when the channel is taken out
+        :param start: first day of the range, by the journeys' last event (optional)
+        :param end: last day of the range, included (optional)
+        :return: Series indexed by channel, 0 to 1
+        """
+        n = len(self.channels)
+        counts = self._transitions(*self._slice(start, end)).astype(np.float64)
+        leaving = counts.sum(axis=1, keepdims=True)
+        probabilities = np.divide(counts, leaving, out=np.zeros_like(counts), where=leaving > 0)
+        # Absorption into conversion from the transient states (channels and start)
+        transient = probabilities[:n + 1, :n + 1]
+        exits = probabilities[:n + 1, n + 1]
+        # One system per removed channel, transitions into it are sent to null, plus the full chain
+        systems = np.broadcast_to(transient, (n + 1, n + 1, n + 1)).copy()
+        systems[np.arange(n), :, np.arange(n)] = 0
+        absorbed = np.linalg.solve(np.eye(n + 1) - systems, np.broadcast_to(exits, (n + 1, n + 1))[..., None])
+        base = absorbed[n, n, 0]
+        effects = 1 - absorbed[:n, n, 0] / base if base > 0 else np.zeros(n)
+        return pd.Series(np.clip(effects, 0, 1), index=self.channels, name=MARKOV)
+
+    def credit(self, start=None, end=None) -> pd.DataFrame:
+        """
+        Conversions credited to each channel by every attribution model (MODELS)
+        :param start: first day of the range, by the journeys' last event (optional)
+        :param end: last day of the range, included (optional)
+        :return: DataFrame indexed by channel with a column per model, each summing
+                 to the conversions of the range
+        """
+        n = len(self.channels)
+        a, b, t0, t1 = self._slice(start, end)
+        converted = self.converted[a:b]
+        conversions = converted.sum()
+        firsts, lasts = self.bounds[a:b], self.bounds[a + 1:b + 1] - 1
+        codes = self.codes[t0:t1]
+        # Touches of converted journeys only
+        counted = converted[self.journey[t0:t1] - a]
+        credit = {
+            FIRST_TOUCH: np.bincount(self.codes[firsts[converted]], minlength=n),
+            LAST_TOUCH: np.bincount(self.codes[lasts[converted]], minlength=n),
+            LINEAR: np.bincount(codes, weights=counted * self.linear[t0:t1], minlength=n),
+            TIME_DECAY: np.bincount(codes, weights=counted * self.decay[t0:t1], minlength=n),
+        }
+        effects = self.removal_effects(start, end).to_numpy()
+        credit[MARKOV] = effects / effects.sum() * conversions if effects.sum() > 0 else np.zeros(n)
+        return pd.DataFrame({model: np.asarray(values, dtype=np.float64) for model, values in credit.items()},
+                            index=self.channels)
+
+
+def market_journeys(df: pd.DataFrame) -> Journeys:
+    """
+    Journeys of market_data behind the attribution charts
+    """
+    return Journeys(df["Event DateTime"], df["Channel"], df["Event Sequence"], df["Is Target"])
+
+
+# Journeys name -> (frame they split, builder)
+JOURNEYS = {
+    "market_journeys": ("market_data", market_journeys),
+}
+
+
+def build_journeys(frames: dict) -> dict:
+    """
+    Builds the journeys of the given prepared frames
+    :param frames: frame name -> prepared DataFrame
+    :return: journeys name -> Journeys, for those whose frame is in frames
+    """
+    return {name: build(frames[source]) for name, (source, build) in JOURNEYS.items() if source in frames}
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+
+from store.loader import LoadReport
+from store.dataset import Dataset, available_frames, build_dataset, worksheet_revision
+
+logger = logging.getLogger(__name__)
+
+
+class DataLoadError(Exception):
+    """Raised when no frame can be built from the loaded worksheets and no cached dataset is available."""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__("; ".join(report.error_messages()))
+
+
+class DataCache:
+    """
+    Process-wide cache of the prepared Dataset. One instance is shared by all
+    Streamlit sessions, so reruns and new sessions reuse the same frames
+    instead of re-reading, re-merging and re-preprocessing the worksheets.
+
+    The worksheets are re-fetched once the TTL expires or after invalidate().
+    The Dataset is only rebuilt when a worksheet's content hash changed.
+    When some worksheets fail on the first load, the frames of the others are
+    built and served; failures after that keep serving the cached Dataset.
+    When a warm start source (e.g. local snapshots) is given, the first
+    request is served from it while the real source is fetched in the
+    background; later expiries are refreshed in the background as well.
+    """
+
+    def __init__(self, fetch, build=build_dataset, ttl: float = 600,
+                 warm_start=None, on_update=None, on_built=None):
+        """
+        :param fetch: callable returning a LoadReport with the raw worksheets
+        :param build: callable turning (raw frames, revisions, previous=, appended=) into a Dataset
+        :param ttl: seconds before the worksheets are fetched again
+        :param warm_start: callable returning a LoadReport to serve before the first fetch (optional)
+        :param on_update: callable receiving (raw frames, revisions) whenever fetched data changed (optional)
+        :param on_built: callable receiving each fetched LoadReport once the Dataset reflects it,
+                         e.g. to commit what an IncrementalReader read (optional)
+        """
+        self._fetch = fetch
+        self._build = build
+        self._warm_start = warm_start
+        self._on_update = on_update
+        self._on_built = on_built
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._dataset = None
+        self._expires_at = 0.0
+        self.last_report = None
+
+    @property
+    def version(self) -> str:
+        return self._dataset.version if self._dataset is not None else ""
+
+    def invalidate(self):
+        """
+        Forces the next get() to fetch the worksheets again
+        """
+        with self._lock:
+            self._expires_at = 0.0
+
+    def refresh(self) -> Dataset:
+        """
+        Fetches the worksheets now and waits for the result
+        :return: the refreshed Dataset
+        """
+        report = self._fetch()
+        with self._lock:
+            self._refresh(report)
+            return self._dataset
+
+    def get(self) -> Dataset:
+        """
+        Returns the cached Dataset. Blocks only when nothing has been loaded
+        yet; an expired Dataset is served while it is refreshed in the background.
+        :return: the shared Dataset
+        """
+        with self._lock:
+            if self._dataset is None:
+                if self._warm_start is not None and self._start_warm():
+                    self._refresh_in_background()
+                else:
+                    self._refresh(self._fetch())
+            elif time.monotonic() >= self._expires_at:
+                self._refresh_in_background()
+            return self._dataset
+
+    def wait(self, timeout: float = None):
+        """
+        Waits for a running background refresh to finish
+        """
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _start_warm(self) -> bool:
+        try:
+            report = self._warm_start()
+        except Exception as e:
+            logger.warning("Warm start failed: %s", e)
+            return False
+        if not report.ok or not report.frames:
+            return False
+        revisions = self._revisions(report)
+        self._dataset = self._build(report.frames, revisions)
+        self.last_report = LoadReport(timings=report.timings, revisions=revisions)
+        # Already expired, so the real source is fetched right away
+        self._expires_at = 0.0
+        logger.info("Warm started data version %s", self._dataset.version)
+        return True
+
+    def _refresh_in_background(self):
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        # Push the expiry out so other sessions don't queue refreshes meanwhile
+        self._expires_at = time.monotonic() + self.ttl
+
+        def run():
+            try:
+                report = self._fetch()
+                with self._lock:
+                    self._refresh(report)
+            except Exception as e:
+                logger.warning("Background refresh failed: %s", e)
+
+        self._refresh_thread = threading.Thread(target=run, name="data-cache-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    @staticmethod
+    def _revisions(report) -> dict:
+        return {name: report.revisions.get(name) or worksheet_revision(df)
+                for name, df in report.frames.items()}
+
+    def _refresh(self, report):
+        # Keep timings and errors only, the raw frames are dropped after the build
+        self.last_report = LoadReport(timings=report.timings, errors=report.errors)
+        self._expires_at = time.monotonic() + self.ttl
+        if not report.ok:
+            if self._dataset is not None:
+                logger.warning("Serving cached data version %s: %s", self._dataset.version,
+                               "; ".join(report.error_messages()))
+                return
+            if not available_frames(report.frames):
+                raise DataLoadError(report)
+            # Nothing cached yet: build the frames whose worksheets all loaded, the
+            # others are missing from the Dataset until a refresh succeeds
+            logger.warning("Building the available frames only: %s", "; ".join(report.error_messages()))
+
+        revisions = self._revisions(report)
+        self.last_report.revisions = revisions
+        if self._dataset is not None and revisions == self._dataset.revisions:
+            logger.info("Worksheets unchanged, keeping data version %s", self._dataset.version)
+            if self._on_built is not None:
+                self._on_built(report)
+            return
+        # A failed build leaves the report uncommitted, its appended rows are read again next time
+        self._dataset = self._build(report.frames, revisions, previous=self._dataset,
+                                    appended=report.appended)
+        logger.info("Built data version %s", self._dataset.version)
+        if self._on_built is not None:
+            self._on_built(report)
+        if self._on_update is not None:
+            try:
+                self._on_update(report.frames, revisions)
+            except Exception as e:
+                logger.warning("Data update hook failed: %s", e)
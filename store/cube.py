@@ -0,0 +1,272 @@
+import numpy as np
+import pandas as pd
+
+from constants import CUSTOMER_SKETCH
+from store.schema import concat_aligned
+from store.sketch import SKETCHES
+
+# Every cell table is keyed by the period, plus at most one dimension
+PERIOD_KEYS = ["Year", "Month"]
+# Name of the cell table without a dimension (Year × Month only)
+TOTAL = ""
+ROWS = "Rows"
+CUSTOMERS = "Customers"
+REPEAT_CUSTOMERS = "Repeat Customers"
+REPEAT_PURCHASES = "Repeat Purchases"
+# Column holding the distinct-customer sketch of each cell
+SKETCH = "_sketch"
+
+SALES_DIMENSIONS = ["Dash Segment", "Loyalty Group", "Conversion Country", "Product Item Name"]
+MARKET_DIMENSIONS = ["Channel", "Event Sequence"]
+
+
+def count_column(measure: str) -> str:
+    """
+    Name of the column counting the non-missing values of a measure, the divisor of its mean
+    """
+    return f"{measure} Count"
+
+
+def _union_by(sketch, sketches: pd.Series, ids: np.ndarray, n: int) -> list:
+    """
+    Unions the sketches sharing a group id
+    :param sketch: the sketch kind, see store.sketch
+    :param sketches: one sketch per cell
+    :param ids: group id of each cell, 0..n-1
+    :param n: number of groups
+    :return: list of n sketches
+    """
+    order = np.argsort(ids, kind="stable")
+    bounds = np.searchsorted(ids[order], np.arange(n + 1))
+    values = sketches.to_numpy()
+    return [sketch.union(values[order[a:b]]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+class KpiCube:
+    """
+    Monthly aggregate cube of a prepared frame, built once per data version.
+    For the period alone (TOTAL) and for each dimension it holds one cell per
+    Year × Month [× dimension value] with:
+        - additive measures: sums of the measure columns, ROWS, and the
+          non-missing counts of the measures that are averaged,
+        - a distinct-customer sketch, mergeable by union, and the
+          customers buying more than once within the cell (REPEAT_CUSTOMERS)
+          with their purchases (REPEAT_PURCHASES).
+
+    Charts read rollups of the cube, so rendering a page costs O(cells)
+    instead of O(rows). Distinct customers of any period or segment are exact
+    with the "exact" sketch and within a few percent with "hll", see
+    constants.CUSTOMER_SKETCH. Repeat counts are exact at the cube's own
+    grain; rolled up over months they count customer-months.
+    """
+
+    def __init__(self, cells: dict, customers: pd.Index = None, sketch=None):
+        """
+        :param cells: dimension name (TOTAL for none) -> cell table
+        :param customers: customer labels the sketch codes refer to, None without a distinct column
+        :param sketch: the sketch kind of the cells, see store.sketch; the configured one by default
+        """
+        self.cells = cells
+        self.customers = customers
+        self.sketch = SKETCHES[CUSTOMER_SKETCH] if sketch is None else sketch
+
+    @property
+    def dimensions(self) -> list:
+        return [name for name in self.cells if name != TOTAL]
+
+    @property
+    def years(self) -> list:
+        return sorted(set(self.cells[TOTAL]["Year"].values))
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.cells.values())
+
+    def rollup(self, by=(), year=None, dates=None):
+        """
+        Aggregates the cells to a coarser grain
+        :param by: columns to group by, any of Year, Month and one dimension; empty for the grand total
+        :param year: keep only the cells of this year (optional)
+        :param dates: (start, end) days, keep only the cells of the months they span (optional)
+        :return: DataFrame indexed by the by columns, or a Series for the grand total, with the
+                 summed measures and the number of distinct customers (CUSTOMERS)
+        """
+        by = list(by)
+        dimensions = [key for key in by if key not in PERIOD_KEYS]
+        if len(dimensions) > 1:
+            raise ValueError(f"The cube has no cells by {dimensions}, roll up one dimension at a time")
+        table = self.cells[dimensions[0] if dimensions else TOTAL]
+        if year is not None:
+            table = table[table["Year"] == year]
+        if dates is not None:
+            first, last = (_period_id(day) for day in dates)
+            periods = _period_ids(table)
+            table = table[(periods >= first) & (periods <= last)]
+        keys = PERIOD_KEYS + dimensions
+        measures = [col for col in table.columns if col not in keys and col != SKETCH]
+        if not by:
+            totals = table[measures].sum()
+            if SKETCH in table:
+                totals[CUSTOMERS] = self.sketch.cardinality(self.sketch.union(table[SKETCH]))
+            return totals
+        grouper = table.groupby(by, observed=True, sort=False)
+        result = grouper[measures].sum()
+        if SKETCH in table:
+            sketches = _union_by(self.sketch, table[SKETCH], grouper.ngroup().to_numpy(), grouper.ngroups)
+            result[CUSTOMERS] = [self.sketch.cardinality(sketch) for sketch in sketches]
+        return _restore_keys(result.reset_index(), table[by].dtypes).set_index(by)
+
+    def update(self, other: "KpiCube") -> "KpiCube":
+        """
+        Replaces the cells of the periods other was built for, e.g. the months
+        rows were appended to
+        :param other: cube built from every row of the replaced periods
+        :return: the updated cube
+        """
+        if other.sketch.name != self.sketch.name:
+            raise ValueError(f"Cannot merge {other.sketch.name} sketches into a cube of {self.sketch.name} sketches")
+        customers, other_cells = self.customers, other.cells
+        if self.customers is not None and not other.customers.equals(self.customers):
+            customers = self.customers.append(other.customers.difference(self.customers, sort=False))
+            remap = customers.get_indexer(other.customers).astype(np.int32)
+            other_cells = {name: table.assign(**{SKETCH: self.sketch.recode(table[SKETCH], remap)})
+                           for name, table in other.cells.items()}
+        periods = np.unique(_period_ids(other.cells[TOTAL]))
+        cells = {}
+        for name, table in self.cells.items():
+            kept = table[~np.isin(_period_ids(table), periods)]
+            keys = PERIOD_KEYS + ([name] if name != TOTAL else [])
+            cells[name] = concat_aligned([kept, other_cells[name]]).sort_values(keys, ignore_index=True)
+        return KpiCube(cells, customers, self.sketch)
+
+
+def _period_ids(df: pd.DataFrame) -> np.ndarray:
+    # Year and the code of the ordered Month categorical combined into one integer
+    return df["Year"].to_numpy(dtype="int64") * 12 + df["Month"].cat.codes.to_numpy()
+
+
+def _period_id(day) -> int:
+    day = pd.Timestamp(day)
+    return day.year * 12 + day.month - 1
+
+
+def _restore_keys(cells: pd.DataFrame, dtypes) -> pd.DataFrame:
+    """
+    Casts the group keys back to their original types and sorts the cells by them.
+    With observed=True, pandas 1.5 reorders the categories of categorical keys by
+    first appearance, which would also break the calendar order of Month.
+    """
+    dtypes = dict(dtypes)
+    for col, dtype in dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            # astype would be a no-op: unordered dtypes with the same categories compare equal in any order
+            cells[col] = cells[col].cat.set_categories(dtype.categories, ordered=dtype.ordered)
+        else:
+            cells[col] = cells[col].astype(dtype)
+    return cells.sort_values(list(dtypes), ignore_index=True)
+
+
+def _cells(keys: list, values: pd.DataFrame, codes: np.ndarray = None, customers: pd.Index = None,
+           sketch=None) -> pd.DataFrame:
+    """
+    One cell per combination of keys with the summed values and, given customer
+    codes, the distinct-customer sketch and repeat purchase counts
+    """
+    grouper = values.groupby(keys, observed=True, sort=False)
+    cells = grouper.sum()
+    if codes is not None:
+        n_codes = max(len(customers), 1)
+        cell = grouper.ngroup().to_numpy()
+        valid = codes >= 0
+        # Purchases per (cell, customer), sorted by cell
+        pairs, purchases = np.unique(cell[valid].astype(np.int64) * n_codes + codes[valid], return_counts=True)
+        owner = pairs // n_codes
+        cells[SKETCH] = sketch.cells(owner, pairs % n_codes, len(cells), customers)
+        repeat = purchases > 1
+        cells[REPEAT_CUSTOMERS] = np.bincount(owner, weights=repeat, minlength=len(cells))
+        cells[REPEAT_PURCHASES] = np.bincount(owner, weights=purchases * repeat, minlength=len(cells))
+    return _restore_keys(cells.reset_index(), {key.name: key.dtype for key in keys})
+
+
+def build_cube(df: pd.DataFrame, dimensions: list, measures: pd.DataFrame, averaged=(),
+               distinct: str = None, sketch: str = None) -> KpiCube:
+    """
+    Aggregates a prepared frame into a KpiCube
+    :param df: frame with Year, Month and the dimension columns
+    :param dimensions: columns to build a cell table for, besides the period alone
+    :param measures: additive measure columns, aligned with df; missing values are skipped
+    :param averaged: measures that charts average, their non-missing counts are kept too
+    :param distinct: categorical column whose distinct values are sketched (optional)
+    :param sketch: "exact" or "hll", defaults to constants.CUSTOMER_SKETCH
+    :return: the cube
+    """
+    values = measures.assign(**{ROWS: 1}, **{count_column(m): measures[m].notna() for m in averaged})
+    values = values.astype({col: "float64" for col in values.columns})
+    sketch = SKETCHES[CUSTOMER_SKETCH if sketch is None else sketch]
+    codes = customers = None
+    if distinct is not None:
+        codes = df[distinct].cat.codes.to_numpy()
+        customers = df[distinct].cat.categories
+    period = [df[key] for key in PERIOD_KEYS]
+    cells = {TOTAL: _cells(period, values, codes, customers, sketch)}
+    for dimension in dimensions:
+        cells[dimension] = _cells(period + [df[dimension]], values, codes, customers, sketch)
+    return KpiCube(cells, customers, sketch)
+
+
+def sales_cube(df: pd.DataFrame, sketch: str = None) -> KpiCube:
+    """
+    Cube of customers_sales_data behind the sales, customer and overview charts
+    :param sketch: distinct-customer sketch kind, defaults to constants.CUSTOMER_SKETCH
+    """
+    amounts = ["Total Revenue_y", "Gross Profit", "Shipping Amount", "Tax", "Discount", "CLTV Monetary Value"]
+    measures = df[amounts].assign(**{
+        "Churn": df["Churn"],
+        # CLTV to acquisition cost, approximated by the discount; no ratio without a discount
+        "CLTV/CAC": df["CLTV Monetary Value"] / df["Discount"].replace(0, np.nan),
+    })
+    return build_cube(df, SALES_DIMENSIONS, measures, averaged=["CLTV Monetary Value", "CLTV/CAC"],
+                      distinct="Customer_ID", sketch=sketch)
+
+
+def market_cube(df: pd.DataFrame) -> KpiCube:
+    """
+    Cube of market_data behind the marketing attribution page
+    """
+    # Event Sequence is also a dimension, its sum measures the visitors' engagement
+    measures = df[["AOV", "Is Target"]].assign(Engagement=df["Event Sequence"])
+    return build_cube(df, MARKET_DIMENSIONS, measures, averaged=["AOV", "Engagement"])
+
+
+def products_cube(df: pd.DataFrame) -> KpiCube:
+    """
+    Cube of products_data behind the demand elasticity charts, one cell per Product × Year × Month
+    """
+    measures = df[["Base Price", "Units Sold"]]
+    return build_cube(df, ["Product"], measures, averaged=["Base Price"])
+
+
+# Cube name -> (frame it aggregates, builder)
+CUBES = {
+    "sales_cube": ("customers_sales_data", sales_cube),
+    "market_cube": ("market_data", market_cube),
+    "products_cube": ("products_data", products_cube),
+}
+
+
+def build_cubes(frames: dict) -> dict:
+    """
+    Builds the cubes of the given prepared frames
+    :param frames: frame name -> prepared DataFrame
+    :return: cube name -> KpiCube, for the cubes whose frame is in frames
+    """
+    return {name: build(frames[source]) for name, (source, build) in CUBES.items() if source in frames}
+
+
+def touched_periods(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    The rows of df in the periods (Year, Month) that rows fall in
+    :param df: prepared frame
+    :param rows: new rows of the frame
+    :return: filtered df, to rebuild the cells of those periods from
+    """
+    return df[np.isin(_period_ids(df), np.unique(_period_ids(rows)))]
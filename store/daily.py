@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+from store.cube import ROWS, count_column
+
+DAY = pd.Timedelta(days=1)
+# Units of the sums -> number per day
+UNITS = {"D": 1, "h": 24}
+
+
+class DailyTotals:
+    """
+    Cumulative daily sums of the additive measures of a prepared frame, built
+    once per data version. The totals of any range of days are the difference
+    of two prefix sums, so a date-range query costs O(1), or O(groups) with a
+    grouping column, whatever the number of rows in the range. With an hourly
+    unit the sums are kept per hour, and series of either grain are read from
+    the same prefix sums.
+    """
+
+    def __init__(self, dates: pd.Series, measures: pd.DataFrame, by: pd.Series = None, unit: str = "D"):
+        """
+        :param dates: datetime column of the rows, the time within a unit is ignored; rows without a date are left out
+        :param measures: additive measure columns, aligned with dates; missing values count as zero
+        :param by: categorical column to keep separate sums per category for (optional)
+        :param unit: grain of the sums, "D" for days or "h" for hours
+        """
+        if unit not in UNITS:
+            raise ValueError(f"Unit must be one of {list(UNITS)}, got {unit!r}")
+        self.unit = unit
+        self.per_day = UNITS[unit]
+        ticks = dates.to_numpy("datetime64[ns]").astype(f"datetime64[{unit}]")
+        valid = ~np.isnat(ticks)
+        codes = np.zeros(len(ticks), dtype=np.int64)
+        self.groups = None
+        if by is not None:
+            codes = by.cat.codes.to_numpy().astype(np.int64)
+            valid &= codes >= 0
+            self.groups = pd.CategoricalIndex(by.cat.categories, dtype=by.dtype, name=by.name)
+        n_groups = 1 if self.groups is None else max(len(self.groups), 1)
+        self._first = ticks[valid].min().astype("datetime64[D]") if valid.any() else np.datetime64("NaT", "D")
+        # Counted from the start of the first day, so every per_day-th prefix sum is a day boundary
+        offsets = (ticks[valid] - self._first).astype(np.int64)
+        n_periods = int(offsets.max()) + 1 if len(offsets) else 0
+        cells = offsets * n_groups + codes[valid]
+        self.measures = list(measures.columns)
+        sums = np.empty((n_periods + 1, n_groups, len(self.measures)))
+        sums[0] = 0
+        for i, measure in enumerate(self.measures):
+            values = np.nan_to_num(measures[measure].to_numpy("float64")[valid])
+            sums[1:, :, i] = np.bincount(cells, weights=values, minlength=n_periods * n_groups) \
+                .reshape(n_periods, n_groups)
+        self.prefix = np.cumsum(sums, axis=0)
+        self.periods = n_periods
+
+    @property
+    def start(self) -> pd.Timestamp:
+        """First day with data, NaT without any"""
+        return pd.Timestamp(self._first)
+
+    @property
+    def end(self) -> pd.Timestamp:
+        """Last day with data, NaT without any"""
+        if not self.periods:
+            return pd.NaT
+        return pd.Timestamp(self._first + np.timedelta64((self.periods - 1) // self.per_day, "D"))
+
+    def _position(self, day, after: bool) -> int:
+        # Prefix index of the start of day, or of the end of day when after is set
+        days = (np.datetime64(pd.Timestamp(day).date(), "D") - self._first).astype(np.int64) + after
+        return int(np.clip(days * self.per_day, 0, self.periods))
+
+    def _range(self, start, end) -> tuple:
+        a = 0 if start is None or not self.periods else self._position(start, after=False)
+        b = self.periods if end is None or not self.periods else self._position(end, after=True)
+        return a, max(a, b)
+
+    def totals(self, start=None, end=None):
+        """
+        Sums of the measures over a range of days
+        :param start: first day of the range, the first day with data by default
+        :param end: last day of the range, included; the last day with data by default
+        :return: Series of the sums per measure, or a DataFrame indexed by the groups
+                 with a grouping column
+        """
+        a, b = self._range(start, end)
+        sums = self.prefix[b] - self.prefix[a]
+        if self.groups is None:
+            return pd.Series(sums[0], index=self.measures)
+        return pd.DataFrame(sums[:len(self.groups)], index=self.groups, columns=self.measures)
+
+    def series(self, measure: str, start=None, end=None, unit: str = None):
+        """
+        Sums of a measure per day or hour over a range of days, including the empty ones
+        :param measure: one of the measures
+        :param start: first day of the range, the first day with data by default
+        :param end: last day of the range, included; the last day with data by default
+        :param unit: "D" or "h", the unit of the sums by default; never finer than it
+        :return: Series indexed by the start of each period, or a DataFrame with a column
+                 per group with a grouping column
+        """
+        unit = self.unit if unit is None else unit
+        if unit not in UNITS or UNITS[unit] > self.per_day:
+            raise ValueError(f"Sums per {self.unit!r} cannot be read per {unit!r}")
+        step = self.per_day // UNITS[unit]
+        a, b = self._range(start, end)
+        # The last period may be cut short by the end of the data
+        bounds = np.append(np.arange(a, b, step), b) if b > a else np.array([a])
+        sums = np.diff(self.prefix[bounds, :, self.measures.index(measure)], axis=0)
+        index = pd.DatetimeIndex(self._first.astype(f"datetime64[{self.unit}]") + bounds[:-1], name=unit)
+        if self.groups is None:
+            return pd.Series(sums[:, 0], index=index, name=measure)
+        return pd.DataFrame(sums[:, :len(self.groups)], index=index, columns=self.groups)
+
+
+def previous_window(start, end) -> tuple:
+    """
+    The range of days of the same length right before [start, end]
+    :return: tuple of the first and last day of that range
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    return start - (end - start + DAY), start - DAY
+
+
+def sales_daily(df: pd.DataFrame) -> DailyTotals:
+    """
+    Daily totals of customers_sales_data behind the sales KPIs
+    """
+    measures = df[["Total Revenue_y", "Gross Profit", "Shipping Amount", "Tax", "Discount"]].assign(**{ROWS: 1})
+    return DailyTotals(df["Valuation Date"], measures)
+
+
+def _market_measures(df: pd.DataFrame) -> pd.DataFrame:
+    return df[["AOV", "Is Target"]].assign(**{
+        "Engagement": df["Event Sequence"],
+        ROWS: 1,
+        count_column("AOV"): df["AOV"].notna(),
+        count_column("Engagement"): df["Event Sequence"].notna(),
+    })
+
+
+def market_daily(df: pd.DataFrame) -> DailyTotals:
+    """
+    Daily totals of market_data behind the marketing KPIs
+    """
+    return DailyTotals(df["Event DateTime"], _market_measures(df))
+
+
+def market_hourly(df: pd.DataFrame) -> DailyTotals:
+    """
+    Hourly totals of market_data per channel behind the attribution indicators,
+    read per hour or per day
+    """
+    return DailyTotals(df["Event DateTime"], _market_measures(df), by=df["Channel"], unit="h")
+
+
+def media_daily(df: pd.DataFrame) -> DailyTotals:
+    """
+    Daily media spend per channel, from media_data
+    """
+    return DailyTotals(df["Date"], df[["Media Spend"]], by=df["Channel"])
+
+
+# Daily totals name -> (frame they sum, builder)
+DAILY = {
+    "sales_daily": ("customers_sales_data", sales_daily),
+    "market_daily": ("market_data", market_daily),
+    "market_hourly": ("market_data", market_hourly),
+    "media_daily": ("media_data", media_daily),
+}
+
+
+def build_daily(frames: dict) -> dict:
+    """
+    Builds the daily totals of the given prepared frames
+    :param frames: frame name -> prepared DataFrame
+    :return: daily totals name -> DailyTotals, for those whose frame is in frames
+    """
+    return {name: build(frames[source]) for name, (source, build) in DAILY.items() if source in frames}
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import weakref
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from constants import SNAPSHOT_DIR, WORKSHEETS
+from store.attribution import JOURNEYS, build_journeys
+from store.cube import CUBES, build_cubes, market_cube, sales_cube, touched_periods
+from store.daily import DAILY, build_daily
+from store.elasticity import ELASTICITIES, build_elasticities
+from store.funnel import FUNNEL_COUNTS, build_funnel_counts
+from store.joins import append_sorted, join_customers_sales, join_financials
+from store.mapped import MappedTable, map_frame, mapped_path
+from store.partitions import PARTITIONS, build_partitions
+from store.schema import align_categories, apply_schema, concat_aligned, derive_columns, read_only
+from utils import preprocess_data
+
+
+# Worksheets each prepared frame is built from. market_data and media_data are
+# prepared together since they share their Channel categories. The cubes
+# (store.cube.CUBES), year partitions (store.partitions.PARTITIONS), daily
+# totals (store.daily.DAILY), funnel counts (store.funnel.FUNNEL_COUNTS), journeys
+# (store.attribution.JOURNEYS) and elasticity estimates (store.elasticity.ELASTICITIES)
+# are built from the frames they aggregate, split or are fitted on.
+FRAME_SOURCES = {
+    "customers_sales_data": ("customers_report", "sales_report"),
+    "cash_flow_data": ("balance_sheet", "income_data", "cash_flow"),
+    "products_data": ("products_data",),
+    "products_cube": ("products_data",),
+    "products_elasticity": ("products_data",),
+    "market_data": ("market_data", "media_data"),
+    "media_data": ("market_data", "media_data"),
+    "sales_cube": ("customers_report", "sales_report"),
+    "sales_by_year": ("customers_report", "sales_report"),
+    "market_cube": ("market_data", "media_data"),
+    "sales_daily": ("customers_report", "sales_report"),
+    "market_daily": ("market_data", "media_data"),
+    "market_hourly": ("market_data", "media_data"),
+    "market_journeys": ("market_data", "media_data"),
+    "market_funnel": ("market_data", "media_data"),
+    "media_daily": ("market_data", "media_data"),
+}
+
+
+# id of a frame handed out by a Dataset -> (weak reference to it, data version of the Dataset)
+_versions = {}
+
+
+def _tag(frame, version: str):
+    key = id(frame)
+
+    def forget(ref):
+        # Only while the id still belongs to the dead frame
+        if _versions.get(key, (None,))[0] is ref:
+            del _versions[key]
+
+    _versions[key] = (weakref.ref(frame, forget), version)
+
+
+def data_version(frame):
+    """
+    The data version of an object handed out by a Dataset, e.g. to key caches of
+    results computed from it. Frames derived from it, like slices, have none.
+    :param frame: prepared DataFrame, KpiCube, YearPartitions, DailyTotals, FunnelCounts
+                 or Journeys
+    :return: the version of the Dataset, None for objects that do not come from one
+    """
+    entry = _versions.get(id(frame))
+    return entry[1] if entry is not None and entry[0]() is frame else None
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    Immutable snapshot of the prepared dashboard frames, shared by every session.
+    Frames are read-only (see store.schema.read_only): filter or copy before adding columns.
+
+    :param frames: frame name -> prepared DataFrame, MappedTable, KpiCube, YearPartitions, DailyTotals,
+                   FunnelCounts or Journeys
+    :param revisions: worksheet name -> content hash of the raw worksheet
+    :param version: hash over all worksheet revisions, changes whenever any sheet changes
+    """
+    frames: dict = field(default_factory=dict)
+    revisions: dict = field(default_factory=dict)
+    version: str = ""
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        frame = self.frames[name]
+        if isinstance(frame, MappedTable):
+            frame = frame.frame()
+        _tag(frame, self.version)
+        return frame
+
+
+def worksheet_revision(df: pd.DataFrame) -> str:
+    """
+    Content hash of a worksheet, independent of the DataFrame index
+    :param df: the raw worksheet frame
+    :return: short hex digest identifying the worksheet contents
+    """
+    digest = hashlib.sha1("\x1f".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def dataset_version(revisions: dict) -> str:
+    """
+    Combines worksheet revisions into a single data version
+    :param revisions: worksheet name -> revision
+    :return: short hex digest identifying the whole dataset
+    """
+    digest = hashlib.sha1()
+    for name in sorted(revisions):
+        digest.update(f"{name}={revisions[name]};".encode())
+    return digest.hexdigest()[:16]
+
+
+def frame_worksheets(frames) -> tuple:
+    """
+    Worksheets needed to prepare the given frames
+    :param frames: names of prepared frames, keys of FRAME_SOURCES
+    :return: worksheet names, in WORKSHEETS order
+    """
+    needed = {worksheet for frame in frames for worksheet in FRAME_SOURCES[frame]}
+    return tuple(worksheet for worksheet in WORKSHEETS if worksheet in needed)
+
+
+def available_frames(worksheets) -> list:
+    """
+    Frames that can be prepared from the given worksheets
+    """
+    return [frame for frame, sources in FRAME_SOURCES.items() if set(sources) <= set(worksheets)]
+
+
+def _typed(df: pd.DataFrame, worksheet: str) -> pd.DataFrame:
+    return derive_columns(apply_schema(df, worksheet), worksheet)
+
+
+def prepare_frames(raw: dict) -> dict:
+    """
+    Types, derives columns (store.schema.DERIVED_COLUMNS), preprocesses and joins
+    the raw worksheets into the frames the views use.
+    Only the frames whose worksheets are all in raw are prepared, together with their cubes.
+    Called once per data version, the result is shared by every rerun and session.
+    :param raw: worksheet name -> raw DataFrame
+    :return: frame name -> prepared DataFrame or KpiCube
+    """
+    raw = {name: _typed(df, name) for name, df in raw.items()}
+    frames = {}
+    if "customers_report" in raw and "sales_report" in raw:
+        customers_data, sales_data = align_categories(raw["customers_report"], raw["sales_report"], "Customer_ID")
+        sales_data, = preprocess_data([sales_data])
+        frames["customers_sales_data"] = join_customers_sales(customers_data, sales_data)
+    if all(name in raw for name in FRAME_SOURCES["cash_flow_data"]):
+        balance_data, income_data, cash_data = preprocess_data([raw["balance_sheet"], raw["income_data"],
+                                                                raw["cash_flow"]])
+        frames["cash_flow_data"] = join_financials(income_data, balance_data, cash_data)
+    if "products_data" in raw:
+        frames["products_data"] = raw["products_data"]
+    if "market_data" in raw and "media_data" in raw:
+        # Same channel categories in both marketing frames, so per-channel series align
+        market_data, media_data = align_categories(raw["market_data"], raw["media_data"], "Channel")
+        frames["market_data"], frames["media_data"] = preprocess_data([market_data, media_data])
+    frames.update(build_cubes(frames))
+    return frames
+
+
+def append_frames(frames: dict, raw: dict, new_rows: dict) -> dict:
+    """
+    Extends prepared frames with rows appended to the incremental worksheets,
+    typing, preprocessing and joining only the new rows. Only the cube cells of
+    the months the rows fall in are rebuilt.
+    :param frames: frame name -> prepared DataFrame or KpiCube of the previous data version
+    :param raw: worksheet name -> raw DataFrame of the current data version
+    :param new_rows: worksheet name -> raw rows appended since the previous version,
+                     only "sales_report" and "market_data" are supported
+    :return: frame name -> prepared DataFrame or KpiCube
+    """
+    frames = dict(frames)
+    if "sales_report" in new_rows:
+        customers_data = _typed(raw["customers_report"], "customers_report")
+        sales_data = _typed(new_rows["sales_report"], "sales_report")
+        customers_data, sales_data = align_categories(customers_data, sales_data, "Customer_ID")
+        sales_data, = preprocess_data([sales_data])
+        joined = join_customers_sales(customers_data, sales_data)
+        frames["customers_sales_data"] = append_sorted(frames["customers_sales_data"], joined)
+        frames["sales_cube"] = _update_cube(frames, "sales_cube", joined, sales_cube)
+    if "market_data" in new_rows:
+        market_data = _typed(new_rows["market_data"], "market_data")
+        market_data, = preprocess_data([market_data])
+        combined = concat_aligned([frames["market_data"], market_data])
+        frames["market_data"], frames["media_data"] = align_categories(combined, frames["media_data"], "Channel")
+        frames["market_cube"] = _update_cube(frames, "market_cube", market_data, market_cube)
+    return frames
+
+
+def _update_cube(frames: dict, name: str, new_rows: pd.DataFrame, build):
+    source = frames[CUBES[name][0]]
+    if name not in frames:
+        return build(source)
+    return frames[name].update(build(touched_periods(source, new_rows)))
+
+
+def build_dataset(raw: dict, revisions: dict = None, previous: Dataset = None,
+                  appended: dict = None, mapped=(), directory: str = SNAPSHOT_DIR) -> Dataset:
+    """
+    Builds a Dataset from the raw worksheets. When the only changes since the
+    previous Dataset are rows appended to incremental worksheets, the previous
+    frames are extended instead of being prepared again.
+    :param raw: worksheet name -> raw DataFrame
+    :param revisions: precomputed worksheet revisions (optional)
+    :param previous: the Dataset being replaced (optional)
+    :param appended: worksheet name -> rows appended since previous (optional)
+    :param mapped: names of frames to keep in memory-mapped files instead of in memory
+    :param directory: directory of the memory-mapped files
+    :return: the prepared Dataset
+    """
+    if revisions is None:
+        revisions = {name: worksheet_revision(df) for name, df in raw.items()}
+    version = dataset_version(revisions)
+    paths = {name: mapped_path(name, version, directory) for name in mapped}
+    frames = None
+    derived = {**CUBES, **PARTITIONS, **DAILY, **FUNNEL_COUNTS, **JOURNEYS, **ELASTICITIES}
+    prepared = [name for name in available_frames(raw) if name not in derived]
+    if paths and set(prepared) <= set(paths) and all(map(os.path.exists, paths.values())):
+        # Another process already prepared this version, only the cubes are built here
+        frames = {name: MappedTable(path) for name, path in paths.items() if name in prepared}
+        frames.update(build_cubes({name: table.frame() for name, table in frames.items()}))
+    if frames is None and previous is not None and appended and set(revisions) == set(previous.revisions):
+        changed = {name for name, revision in revisions.items() if previous.revisions[name] != revision}
+        if changed and changed <= set(appended) <= {"sales_report", "market_data"}:
+            frames = append_frames({name: previous[name] for name in previous.frames}, raw,
+                                   {name: appended[name] for name in changed})
+    if frames is None:
+        frames = prepare_frames(raw)
+    for name, path in paths.items():
+        if isinstance(frames.get(name), pd.DataFrame):
+            frames[name] = map_frame(frames[name], path)
+    for frame in frames.values():
+        if isinstance(frame, pd.DataFrame):
+            read_only(frame)
+    # Split after mapping, so the partitions are slices of the mapped frames. The daily
+    # totals, funnel counts, journeys and elasticities are rebuilt in full, a pass of
+    # bincounts over the rows.
+    tables = {name: table.frame() if isinstance(table, MappedTable) else table
+              for name, table in frames.items() if isinstance(table, (pd.DataFrame, MappedTable))}
+    frames.update(build_partitions(tables))
+    frames.update(build_daily(tables))
+    frames.update(build_funnel_counts(tables))
+    frames.update(build_elasticities(tables))
+    frames.update(build_journeys(tables))
+    return Dataset(frames=frames, revisions=dict(revisions), version=version)
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from store.daily import DailyTotals
+
+EVENTS = "Events"
+CONVERSIONS = "Conversions"
+# Column of a funnel holding every event of its group, whatever the stage
+ALL = "All"
+CHANNEL = "Channel"
+WEEK = "Week"
+
+
+@dataclass(frozen=True)
+class Funnel:
+    """
+    Definition of a funnel over the Event Sequence steps
+
+    :param stages: steps in funnel order
+    :param by: None for a single funnel, CHANNEL or WEEK for one funnel per channel or per week
+    :param measure: EVENTS to count the events at each stage, CONVERSIONS to count the converting ones
+    """
+    stages: tuple = (1, 2, 3, 4, 5, 6, 7)
+    by: str = None
+    measure: str = EVENTS
+
+
+# Funnel name -> definition. A new funnel only needs an entry here: every one is
+# read from the same FunnelCounts, without another pass over the events.
+FUNNELS = {
+    "Event Sequence": Funnel(),
+    "Event Sequence by Channel": Funnel(by=CHANNEL),
+    "Event Sequence by Week": Funnel(by=WEEK),
+    "Conversions by Channel": Funnel(by=CHANNEL, measure=CONVERSIONS),
+}
+
+
+class FunnelCounts:
+    """
+    Events and conversions per day, channel and Event Sequence step, counted in
+    one pass over the events once per data version: a DailyTotals over the
+    channel × step cells. Any funnel of a range of days, overall, per channel
+    or per week, is read from its prefix sums.
+    """
+
+    def __init__(self, dates: pd.Series, steps: pd.Series, channels: pd.Series, targets: pd.Series):
+        """
+        :param dates: datetime of each event; events without a date, step or channel are left out
+        :param steps: Event Sequence of each event
+        :param channels: categorical channel of each event
+        :param targets: 1 for a converting event, 0 otherwise
+        """
+        values = steps.to_numpy(dtype="float64", na_value=np.nan)
+        self.stages = np.unique(values[~np.isnan(values)]).astype(np.int64)
+        self.channels = pd.CategoricalIndex(channels.cat.categories, dtype=channels.dtype, name=channels.name)
+        n_stages, n_channels = len(self.stages), len(self.channels)
+        stage = np.searchsorted(self.stages, values)
+        codes = channels.cat.codes.to_numpy().astype(np.int64) * n_stages + stage
+        codes[np.isnan(values) | (channels.cat.codes.to_numpy() < 0)] = -1
+        cells = pd.Series(pd.Categorical.from_codes(codes, categories=np.arange(n_channels * n_stages)),
+                          index=dates.index, name="Cell")
+        measures = pd.DataFrame({EVENTS: 1, CONVERSIONS: targets}, index=dates.index)
+        self.totals = DailyTotals(dates, measures, by=cells)
+
+    @property
+    def start(self) -> pd.Timestamp:
+        return self.totals.start
+
+    @property
+    def end(self) -> pd.Timestamp:
+        return self.totals.end
+
+    def _by_stage(self, sums: np.ndarray) -> np.ndarray:
+        # Sums per cell to sums per channel and step, on the last axis
+        return sums.reshape(sums.shape[:-1] + (len(self.channels), len(self.stages)))
+
+    def counts(self, funnel: Funnel, start=None, end=None) -> pd.DataFrame:
+        """
+        Stage counts of a funnel over a range of days
+        :param funnel: the funnel definition
+        :param start: first day of the range, the first day with data by default
+        :param end: last day of the range, included; the last day with data by default
+        :return: DataFrame with a row per group (a single row without grouping), the ALL
+                 column and a column per stage of the funnel
+        """
+        if funnel.by == WEEK:
+            days = self.totals.series(funnel.measure, start, end, unit="D")
+            # Weeks starting on Monday, labelled by their first day
+            weeks = days.groupby(days.index.to_period("W").start_time).sum()
+            sums = self._by_stage(weeks.to_numpy()).sum(axis=1)
+            index = pd.DatetimeIndex(weeks.index, name=WEEK)
+        else:
+            sums = self._by_stage(self.totals.totals(start, end)[funnel.measure].to_numpy())
+            if funnel.by == CHANNEL:
+                index = self.channels
+            elif funnel.by is None:
+                sums, index = sums.sum(axis=0, keepdims=True), pd.Index([ALL])
+            else:
+                raise ValueError(f"Funnels are grouped by {CHANNEL!r} or {WEEK!r}, got {funnel.by!r}")
+        counts = pd.DataFrame(sums, index=index, columns=self.stages)
+        return pd.concat([counts.sum(axis=1).rename(ALL), counts.reindex(columns=list(funnel.stages), fill_value=0)],
+                         axis=1)
+
+
+def conversion_rates(counts: pd.DataFrame) -> pd.DataFrame:
+    """
+    Share of each stage of a funnel that reaches the next one, in percent
+    :param counts: stage counts, see FunnelCounts.counts
+    :return: DataFrame with a column per stage, the first stage relative to ALL
+    """
+    return counts.iloc[:, 1:] / counts.shift(axis=1).iloc[:, 1:] * 100
+
+
+def market_funnel(df: pd.DataFrame) -> FunnelCounts:
+    """
+    Funnel counts of market_data behind the funnel charts
+    """
+    return FunnelCounts(df["Event DateTime"], df["Event Sequence"], df["Channel"], df["Is Target"])
+
+
+# Funnel counts name -> (frame they count, builder)
+FUNNEL_COUNTS = {
+    "market_funnel": ("market_data", market_funnel),
+}
+
+
+def build_funnel_counts(frames: dict) -> dict:
+    """
+    Builds the funnel counts of the given prepared frames
+    :param frames: frame name -> prepared DataFrame
+    :return: funnel counts name -> FunnelCounts, for those whose frame is in frames
+    """
+    return {name: build(frames[source]) for name, (source, build) in FUNNEL_COUNTS.items() if source in frames}
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+import pandas as pd
+
+from constants import SNAPSHOT_DIR
+from store.dataset import worksheet_revision
+from store.loader import LoadReport, load_concurrently
+from store.schema import DATE_FORMAT, DATETIME_FORMAT, SCHEMAS, parse_dates
+from store.snapshot import append_snapshot, read_manifest, read_snapshot, snapshot_path, write_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Append-only worksheets and the column their rows are ordered by
+WATERMARK_COLUMNS = {"sales_report": "Valuation Date", "market_data": "Event DateTime"}
+# Appended snapshot parts before the snapshot is rewritten as a single file
+MAX_PARTS = 16
+
+
+@dataclass
+class _Ingested:
+    frame: pd.DataFrame
+    revision: str
+    watermark: pd.Timestamp
+
+
+def chain_revision(revision: str, new_rows: pd.DataFrame) -> str:
+    """
+    Revision of a worksheet after appending rows, computed from the new rows only
+    :param revision: revision before the append
+    :param new_rows: the appended rows
+    :return: short hex digest
+    """
+    return hashlib.sha1(f"{revision}+{worksheet_revision(new_rows)}".encode()).hexdigest()[:16]
+
+
+class IncrementalReader:
+    """
+    Reads append-only worksheets (WATERMARK_COLUMNS) incrementally. For each
+    such worksheet it remembers how many rows were ingested and the last date
+    seen (the watermark), and on the next load only parses the rows after
+    them. New rows are appended to the in-memory frame and, when a snapshot
+    directory is given, to the on-disk snapshot as a separate part.
+
+    If the new rows are older than the watermark or their columns changed,
+    the worksheet is read in full again. Edits to rows that were already
+    ingested are not detected, so every full_every-th load of a group of
+    worksheets reads them in full again, and reset() reads everything again.
+
+    What a load read is only remembered, in memory and in the snapshots, once
+    commit() is called for its report, after the report was built into a
+    Dataset. Until then every load reads the rows after the last committed
+    state again, so rows of a load that failed or could not be built are
+    appended by the next one instead of being skipped.
+    """
+
+    def __init__(self, read, directory: str = SNAPSHOT_DIR, columns=None, full_every: int = 24):
+        """
+        :param read: callable (worksheet name, **options) -> DataFrame; options are
+                     pandas parser options such as skiprows
+        :param directory: snapshot directory to seed from and append to, None to stay in memory
+        :param columns: worksheet name -> watermark column, defaults to WATERMARK_COLUMNS
+        :param full_every: read the incremental worksheets in full on every n-th load (0 never)
+        """
+        self._read = read
+        self.directory = directory
+        self.columns = dict(WATERMARK_COLUMNS if columns is None else columns)
+        self.full_every = full_every
+        self._ingested = {}
+        # Loads per group of worksheets, every DataCache loads its own group
+        self._loads = {}
+        # Group of worksheets -> worksheet name -> (read state, appended rows or None after a
+        # full read) of its last load, until committed
+        self._staged = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, worksheets=None) -> LoadReport:
+        return self.load(worksheets)
+
+    def reset(self):
+        """
+        Forgets the watermarks, so the next load reads every worksheet in full
+        """
+        with self._lock:
+            self._ingested.clear()
+            self._staged.clear()
+
+    def watermark(self, name: str):
+        ingested = self._ingested.get(name)
+        return ingested.watermark if ingested is not None else None
+
+    def load(self, worksheets=None) -> LoadReport:
+        """
+        Loads the worksheets, reading only new rows of the append-only ones
+        :param worksheets: names of the worksheets to read, defaults to all WORKSHEETS
+        :return: LoadReport whose revisions and appended rows cover the incremental worksheets
+        """
+        with self._lock:
+            group = None if worksheets is None else tuple(worksheets)
+            self._loads[group] = self._loads.get(group, 0) + 1
+            if self.full_every and self._loads[group] % self.full_every == 0:
+                for name in list(self._ingested) if group is None else group:
+                    self._ingested.pop(name, None)
+            staged = {}
+
+            def read(name):
+                if name in self.columns:
+                    return self._read_incremental(name, staged)
+                return self._read(name)
+
+            report = load_concurrently(read, worksheets)
+            staged = {name: entry for name, entry in staged.items() if name in report.frames}
+            self._staged[group] = staged
+            for name in report.frames:
+                ingested = staged[name][0] if name in staged else self._ingested.get(name)
+                if ingested is not None:
+                    report.revisions[name] = ingested.revision
+            report.appended = {name: rows for name, (_, rows) in staged.items() if rows is not None}
+            return report
+
+    def commit(self, report: LoadReport, worksheets=None):
+        """
+        Remembers what the load of a group of worksheets read, once its report was built
+        into a Dataset, so the next load only reads the rows after it
+        :param report: the LoadReport returned by load()
+        :param worksheets: the worksheets passed to load()
+        """
+        with self._lock:
+            group = None if worksheets is None else tuple(worksheets)
+            staged = self._staged.get(group, {})
+            for name, (ingested, new_rows) in list(staged.items()):
+                # Only the state the report was read with, not that of a later load
+                if report.revisions.get(name) != ingested.revision:
+                    continue
+                del staged[name]
+                self._ingested[name] = ingested
+                if self.directory is None:
+                    continue
+                if new_rows is None:
+                    write_snapshots({name: ingested.frame}, {name: ingested.revision}, self.directory,
+                                    watermarks={name: str(ingested.watermark)})
+                else:
+                    self._persist(name, ingested, new_rows)
+
+    def _dates(self, name: str, df: pd.DataFrame) -> pd.Series:
+        column = self.columns[name]
+        fmt = DATETIME_FORMAT if SCHEMAS.get(name, {}).get(column) == "datetime" else DATE_FORMAT
+        return parse_dates(df[column], fmt)
+
+    def _seed(self, name: str):
+        """
+        Restores the ingestion state of a worksheet from its snapshot
+        """
+        if self.directory is None:
+            return None
+        entry = read_manifest(self.directory).get(name)
+        if not entry or not entry.get("revision") or not os.path.exists(snapshot_path(name, self.directory)):
+            return None
+        frame = read_snapshot(name, self.directory)
+        watermark = entry.get("watermark")
+        watermark = pd.Timestamp(watermark) if watermark else self._dates(name, frame).max()
+        return _Ingested(frame, entry["revision"], watermark)
+
+    def _read_full(self, name: str, staged: dict) -> pd.DataFrame:
+        df = self._read(name)
+        staged[name] = (_Ingested(df, worksheet_revision(df), self._dates(name, df).max()), None)
+        return df
+
+    def _read_incremental(self, name: str, staged: dict) -> pd.DataFrame:
+        ingested = self._ingested.get(name) or self._seed(name)
+        if ingested is None:
+            return self._read_full(name, staged)
+
+        # Row 0 is the header, rows 1..n were ingested already
+        new_rows = self._read(name, skiprows=range(1, len(ingested.frame) + 1))
+        if new_rows.empty:
+            self._ingested[name] = ingested
+            return ingested.frame
+        if list(new_rows.columns) != list(ingested.frame.columns):
+            logger.info("Columns of %s changed, reading it in full", name)
+            return self._read_full(name, staged)
+        dates = self._dates(name, new_rows)
+        if dates.min() < ingested.watermark:
+            logger.info("%s has rows older than its watermark %s, reading it in full", name, ingested.watermark)
+            return self._read_full(name, staged)
+
+        frame = pd.concat([ingested.frame, new_rows], ignore_index=True)
+        ingested = _Ingested(frame, chain_revision(ingested.revision, new_rows),
+                             max(ingested.watermark, dates.max()))
+        staged[name] = (ingested, new_rows)
+        logger.info("Read %d new rows of %s, watermark %s", len(new_rows), name, ingested.watermark)
+        return frame
+
+    def _persist(self, name: str, ingested: _Ingested, new_rows: pd.DataFrame):
+        entry = read_manifest(self.directory).get(name, {})
+        if entry.get("parts", 0) < MAX_PARTS and \
+                append_snapshot(name, new_rows, ingested.revision, str(ingested.watermark), self.directory):
+            return
+        # No snapshot to append to, or too many parts: rewrite it as one file
+        write_snapshots({name: ingested.frame}, {name: ingested.revision}, self.directory,
+                        watermarks={name: str(ingested.watermark)})
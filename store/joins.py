@@ -0,0 +1,72 @@
+import pandas as pd
+
+from store.schema import concat_aligned
+
+# Columns of customers_sales_data the views read. The "_y" suffix marks sales
+# columns that also exist in customers_report, as a plain pd.merge would name them.
+CUSTOMERS_SALES_COLUMNS = [
+    "Customer_ID", "Valuation Date", "Year", "Month",
+    "Dash Segment", "Loyalty Group", "CLTV Monetary Value", "P notAlive", "Churn",
+    "Product Item Name", "Conversion Country", "Total Revenue_y",
+    "Gross Profit", "Shipping Amount", "Tax", "Discount",
+]
+
+SALES_SORT_KEYS = ["Valuation Date", "Customer_ID"]
+FINANCIAL_KEYS = ["Valuation Date", "Year", "Month"]
+
+
+def join_customers_sales(customers_data: pd.DataFrame, sales_data: pd.DataFrame,
+                         columns=None) -> pd.DataFrame:
+    """
+    Joins every sale with its customer's profile, keeping only the given columns.
+    Columns are pruned before the merge, so unused ones are never copied to
+    transaction level. Rows are sorted by Valuation Date and Customer_ID.
+    :param customers_data: one row per customer, with column "Customer_ID"
+    :param sales_data: one row per transaction, with columns "Customer_ID" and "Valuation Date"
+    :param columns: columns to keep, defaults to CUSTOMERS_SALES_COLUMNS
+    :return: the joined frame
+    """
+    columns = set(CUSTOMERS_SALES_COLUMNS if columns is None else columns) | {"Customer_ID"}
+    overlap = (set(customers_data.columns) & set(sales_data.columns)) - {"Customer_ID"}
+    left = customers_data.rename(columns={col: f"{col}_x" for col in overlap})
+    right = sales_data.rename(columns={col: f"{col}_y" for col in overlap})
+    left = left[[col for col in left.columns if col in columns]]
+    right = right[[col for col in right.columns if col in columns]]
+
+    joined = pd.merge(left, right, on="Customer_ID")
+    if isinstance(left["Customer_ID"].dtype, pd.CategoricalDtype) \
+            and not isinstance(joined["Customer_ID"].dtype, pd.CategoricalDtype):
+        # pandas 1.5 returns the key as object whenever the join needs row indexers
+        joined["Customer_ID"] = joined["Customer_ID"].astype(left["Customer_ID"].dtype)
+    sort_keys = [col for col in SALES_SORT_KEYS if col in joined.columns]
+    return joined.sort_values(sort_keys, kind="stable", ignore_index=True)
+
+
+def append_sorted(customers_sales_data: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Appends joined sales to customers_sales_data, keeping it sorted by Valuation Date
+    and Customer_ID. Rows that all come after the existing ones are appended as is,
+    otherwise the result is sorted again.
+    :param customers_sales_data: the joined frame so far
+    :param new_rows: newly joined sales, sorted the same way
+    :return: the combined frame
+    """
+    if new_rows.empty:
+        return customers_sales_data
+    combined = concat_aligned([customers_sales_data, new_rows])
+    if customers_sales_data.empty or \
+            new_rows["Valuation Date"].min() > customers_sales_data["Valuation Date"].max():
+        return combined
+    return combined.sort_values(SALES_SORT_KEYS, kind="stable", ignore_index=True)
+
+
+def join_financials(income_data: pd.DataFrame, balance_data: pd.DataFrame,
+                    cash_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joins the monthly income, balance sheet and cash flow statements.
+    All columns are kept since the accounts page reads most of them.
+    :return: the joined frame, sorted by Valuation Date
+    """
+    temp_df = pd.merge(income_data, balance_data, on=FINANCIAL_KEYS)
+    cash_flow_data = pd.merge(temp_df, cash_data, on=FINANCIAL_KEYS)
+    return cash_flow_data.sort_values("Valuation Date", kind="stable", ignore_index=True)
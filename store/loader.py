@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from constants import WORKSHEETS, CSV_DIR
+
+# CSV exports that are not named after their worksheet
+CSV_FILE_ALIASES = {"income_data": "income_datasheet"}
+# Column names used by the CSV generators that differ from the Google Sheets
+CSV_COLUMN_ALIASES = {"Customer ID": "Customer_ID"}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadReport:
+    """
+    Result of loading a set of worksheets.
+
+    :param frames: worksheet name -> DataFrame for every sheet that loaded.
+    :param timings: worksheet name -> seconds spent reading the sheet.
+    :param errors: worksheet name -> exception raised while reading the sheet.
+    :param revisions: worksheet name -> known content revision (optional, e.g. from a snapshot).
+    :param appended: worksheet name -> rows added since the previous load, for incremental worksheets.
+    """
+    frames: dict = field(default_factory=dict)
+    timings: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    revisions: dict = field(default_factory=dict)
+    appended: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def error_messages(self) -> list:
+        """
+        Human-readable description of every failed worksheet
+        :return: list of messages, one per failed worksheet
+        """
+        return [f"Could not load worksheet '{name}': {type(err).__name__}: {err}"
+                for name, err in self.errors.items()]
+
+
+def _timed(read, worksheet: str):
+    """
+    Reads a single worksheet and measures how long it took
+    :param read: callable taking a worksheet name and returning a DataFrame
+    :param worksheet: name of the worksheet to read
+    :return: tuple of (DataFrame, elapsed seconds)
+    """
+    start = time.perf_counter()
+    df = read(worksheet)
+    return df, time.perf_counter() - start
+
+
+def load_concurrently(read, worksheets=None, max_workers=None) -> LoadReport:
+    """
+    Reads the worksheets concurrently, so a cold load costs roughly the slowest
+    sheet instead of the sum of all reads. A failing sheet does not abort
+    the others; its exception is recorded in the report instead.
+    :param read: callable taking a worksheet name and returning a DataFrame
+    :param worksheets: names of the worksheets to read, defaults to all WORKSHEETS
+    :param max_workers: size of the thread pool, defaults to one thread per worksheet
+    :return: LoadReport with the frames, per-sheet timings and errors
+    """
+    worksheets = list(WORKSHEETS if worksheets is None else worksheets)
+    report = LoadReport()
+    if not worksheets:
+        return report
+
+    # Worker threads need the script context to use st.cache_data inside conn.read
+    ctx = get_script_run_ctx()
+
+    def attach_ctx():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(worksheets),
+                            initializer=attach_ctx) as pool:
+        futures = {name: pool.submit(_timed, read, name) for name in worksheets}
+        for name, future in futures.items():
+            try:
+                df, elapsed = future.result()
+            except Exception as e:
+                report.errors[name] = e
+                logger.warning("Failed to load worksheet %s: %s", name, e)
+                continue
+            if not isinstance(df, pd.DataFrame):
+                report.errors[name] = TypeError(f"expected a DataFrame, got {type(df).__name__}")
+                continue
+            report.frames[name] = df
+            report.timings[name] = elapsed
+            logger.info("Loaded worksheet %s (%d rows) in %.2fs", name, len(df), elapsed)
+    return report
+
+
+def load_worksheets(conn, worksheets=None, max_workers=None, **read_kwargs) -> LoadReport:
+    """
+    Reads the worksheets from Google Sheets concurrently
+    :param conn: the GSheetsConnection (or anything with a compatible read method)
+    :param worksheets: names of the worksheets to read, defaults to all WORKSHEETS
+    :param max_workers: size of the thread pool, defaults to one thread per worksheet
+    :param read_kwargs: extra keyword arguments passed to conn.read
+    :return: LoadReport with the frames, per-sheet timings and errors
+    """
+    return load_concurrently(lambda name: conn.read(worksheet=name, **read_kwargs),
+                             worksheets, max_workers)
+
+
+def read_csv_worksheet(directory: str, worksheet: str, **options) -> pd.DataFrame:
+    """
+    Reads a worksheet exported as CSV, e.g. by Data_Add/manu.py
+    :param directory: directory holding the CSV files
+    :param worksheet: name of the worksheet
+    :param options: extra keyword arguments passed to pd.read_csv, e.g. skiprows
+    :return: DataFrame with the worksheet contents
+    """
+    path = os.path.join(directory, f"{worksheet}.csv")
+    if not os.path.exists(path) and worksheet in CSV_FILE_ALIASES:
+        path = os.path.join(directory, f"{CSV_FILE_ALIASES[worksheet]}.csv")
+    df = pd.read_csv(path, **options)
+    return df.rename(columns=CSV_COLUMN_ALIASES)
+
+
+def load_csv_worksheets(directory: str = CSV_DIR, worksheets=None) -> LoadReport:
+    """
+    Reads the worksheets from local CSV files, for running the dashboard offline
+    :param directory: directory holding the CSV files
+    :param worksheets: names of the worksheets to read, defaults to all WORKSHEETS
+    :return: LoadReport with the frames, per-sheet timings and errors
+    """
+    return load_concurrently(lambda name: read_csv_worksheet(directory, name), worksheets)
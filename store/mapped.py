@@ -0,0 +1,75 @@
+import glob
+import logging
+import os
+
+import pandas as pd
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+
+# Layout of the prepared frames; bump it when their columns change, so files
+# written by an older version of the code are not mapped
+FRAME_FORMAT = 2
+
+
+def mapped_path(frame: str, version: str, directory: str) -> str:
+    return os.path.join(directory, f"{frame}.v{version}.f{FRAME_FORMAT}.arrow")
+
+
+class MappedTable:
+    """
+    Read-only table backed by a memory-mapped, uncompressed Feather (Arrow IPC)
+    file. The mapped pages live in the operating system's page cache, so every
+    session and every worker process that opens the file shares one copy, and
+    only the pages of the columns actually read are loaded.
+
+    frame() hands the columns to pandas without copying them: numeric, date and
+    categorical columns become read-only arrays pointing into the mapping.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._table = feather.read_table(path, memory_map=True)
+
+    @property
+    def columns(self) -> list:
+        return self._table.column_names
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def frame(self, columns=None) -> pd.DataFrame:
+        """
+        The table, or a slice of its columns, as a DataFrame sharing the mapped memory
+        :param columns: names of the columns to read, defaults to all
+        :return: read-only DataFrame, filter or copy before adding columns
+        """
+        table = self._table if columns is None else self._table.select(list(columns))
+        # split_blocks keeps every column in its own block, which lets pandas use the buffers as they are
+        return table.to_pandas(split_blocks=True, use_threads=False)
+
+
+def map_frame(df: pd.DataFrame, path: str) -> MappedTable:
+    """
+    Writes a frame to a Feather file, unless another process already wrote it,
+    and maps it. Files of older versions of the same frame are removed; processes
+    that still map them keep their mapping until they switch versions.
+    :param df: the prepared frame
+    :param path: file path, as given by mapped_path
+    :return: the mapped table
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+        os.replace(tmp, path)
+        logger.info("Wrote memory-mapped table %s", path)
+    prefix = os.path.basename(path).split(".v")[0]
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f"{prefix}.v*.arrow")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return MappedTable(path)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+class YearPartitions:
+    """
+    Read-only handle splitting a prepared frame by Year once per data version.
+    Each year is a contiguous run of rows, so a partition is a row slice that
+    shares the frame's memory, and looking one up costs nothing compared to
+    a boolean mask over every row.
+    """
+
+    def __init__(self, df: pd.DataFrame, date_column: str = None):
+        """
+        :param df: frame with a Year column, best sorted by date as the sales frame is;
+                   otherwise it is sorted by Year once here
+        :param date_column: datetime column the rows are selected on by between (optional)
+        """
+        years = df["Year"]
+        if not years.is_monotonic_increasing:
+            df = df.iloc[np.argsort(years.to_numpy(), kind="stable")]
+            years = df["Year"]
+        values = years.to_numpy()
+        starts = np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1])
+        stops = np.append(starts[1:], len(values))
+        self.frame = df
+        self.date_column = date_column
+        # Rows without a date have no Year and belong to no partition
+        self._bounds = {int(values[start]): (start, stop) for start, stop in zip(starts, stops)
+                        if not pd.isna(values[start])}
+        self.years = sorted(self._bounds)
+        # Checked once, the frame does not change for a data version: between() binary
+        # searches these dates when the frame is sorted by them, None otherwise
+        dates = df[date_column] if date_column is not None else None
+        self._sorted_dates = dates.to_numpy() if dates is not None and dates.is_monotonic_increasing else None
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __contains__(self, year) -> bool:
+        return year in self._bounds
+
+    def __getitem__(self, year) -> pd.DataFrame:
+        """
+        The rows of a year, empty for a year without data
+        """
+        start, stop = self._bounds.get(year, (0, 0))
+        return self.frame.iloc[start:stop]
+
+    def current_and_previous(self, year):
+        """
+        The partitions of a year and of the year before it in the data,
+        the same partition twice for the first year
+        """
+        index = self.years.index(year)
+        return self[year], self[self.years[index - 1] if index else year]
+
+    def between(self, start, end) -> pd.DataFrame:
+        """
+        The rows dated from day start to day end, both included: a row slice
+        found by binary search when the frame is sorted by date, a filtered copy otherwise
+        """
+        start, stop = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+        values = self._sorted_dates
+        if values is not None:
+            return self.frame.iloc[values.searchsorted(start.to_datetime64()):values.searchsorted(stop.to_datetime64())]
+        dates = self.frame[self.date_column]
+        return self.frame[(dates >= start) & (dates < stop)]
+
+
+# Partition handle name -> (frame it splits, its date column)
+PARTITIONS = {
+    "sales_by_year": ("customers_sales_data", "Valuation Date"),
+}
+
+
+def build_partitions(frames: dict) -> dict:
+    """
+    Splits the given prepared frames by Year
+    :param frames: frame name -> prepared DataFrame
+    :return: partition handle name -> YearPartitions, for the handles whose frame is in frames
+    """
+    return {name: YearPartitions(frames[source], date_column)
+            for name, (source, date_column) in PARTITIONS.items() if source in frames}
@@ -0,0 +1,271 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from constants import MONTHS
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Type of every Month column: the abbreviated month names in calendar order
+MONTH_DTYPE = pd.CategoricalDtype(MONTHS, ordered=True)
+
+# Declared column types per worksheet. Columns that are not declared keep the
+# type pandas inferred; declared columns that are missing are ignored.
+#   "category"  repeated labels, stored as pandas categoricals
+#   "date"      parsed with DATE_FORMAT
+#   "datetime"  parsed with DATETIME_FORMAT
+#   "month"     month numbers 1-12, stored as MONTH_DTYPE
+#   "int"       smallest integer type that holds the values
+#   "float32"   ratios and probabilities, where float32 precision is plenty
+#   "float64"   amounts of money, kept at full precision
+SCHEMAS = {
+    "balance_sheet": {
+        "Valuation Date": "date",
+    },
+    "income_data": {
+        "Valuation Date": "date",
+    },
+    "cash_flow": {
+        "Valuation Date": "date",
+    },
+    "customers_report": {
+        "Customer_ID": "category",
+        "Dash Segment": "category",
+        "Loyalty Group": "category",
+        "CLTV Monetary Value": "float64",
+        "Total Revenue": "float64",
+        "P notAlive": "float32",
+    },
+    "sales_report": {
+        "Valuation Date": "date",
+        "Customer_ID": "category",
+        "Product Item Name": "category",
+        "Conversion Country": "category",
+        "Units Sold": "int",
+        "Total Revenue": "float64",
+        "Gross Profit": "float64",
+        "Shipping Amount": "float64",
+        "Tax": "float64",
+        "Discount": "float64",
+    },
+    "products_data": {
+        "Year": "int",
+        "Month": "month",
+        "Product": "category",
+        "Base Price": "float64",
+        "Price Elasticity": "float32",
+        "Units Sold": "int",
+        "Shipping and Tax Ratio": "float32",
+        "Price Ratio": "float32",
+    },
+    "market_data": {
+        "Event DateTime": "datetime",
+        "Channel": "category",
+        "Event Sequence": "int",
+        "AOV": "float64",
+        "Is Target": "int",
+    },
+    "media_data": {
+        "Date": "date",
+        "Channel": "category",
+        "Media Spend": "float64",
+    },
+}
+
+# Customers whose probability of no longer being active exceeds this are counted as churned
+CHURN_THRESHOLD = 0.5
+
+# Columns derived from the typed worksheet columns, computed once per load by
+# derive_columns. Each function takes the typed worksheet frame and returns the column.
+DERIVED_COLUMNS = {
+    "customers_report": {
+        "Churn": lambda df: (df["P notAlive"] > CHURN_THRESHOLD).astype("int8"),
+    },
+    "products_data": {
+        # The sheet has no dates, only the period of each row
+        "Date": lambda df: month_start(df["Year"], df["Month"]),
+    },
+}
+
+
+def parse_dates(values: pd.Series, fmt: str = DATE_FORMAT) -> pd.Series:
+    """
+    Parses a column of dates with an explicit format, inferring the format
+    only when the values do not match it
+    :param values: the column to parse
+    :param fmt: the expected strftime format
+    :return: datetime64 column
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    try:
+        return pd.to_datetime(values, format=fmt)
+    except (ValueError, TypeError):
+        logger.warning("Column %s does not match %s, inferring its date format", values.name, fmt)
+        return pd.to_datetime(values)
+
+
+def _to_int(values: pd.Series) -> pd.Series:
+    values = pd.to_numeric(values)
+    # Blank cells come in as NaN; such columns stay float rather than becoming nullable
+    if values.isna().any() or not np.array_equal(values, np.floor(values)):
+        return values
+    return pd.to_numeric(values.astype(np.int64), downcast="integer")
+
+
+def month_categorical(numbers: pd.Series) -> pd.Series:
+    """
+    Converts month numbers to the ordered MONTH_DTYPE categorical
+    :param numbers: months as numbers 1-12, missing values allowed
+    :return: ordered categorical column with the MONTHS categories
+    """
+    if isinstance(numbers.dtype, pd.CategoricalDtype):
+        return numbers.cat.set_categories(MONTH_DTYPE.categories, ordered=True)
+    # A missing month becomes code -1; numbers outside 1-12 raise a ValueError
+    codes = pd.to_numeric(numbers).fillna(0).to_numpy(dtype="int8") - 1
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=MONTH_DTYPE), index=numbers.index, name=numbers.name)
+
+
+def month_start(years: pd.Series, months: pd.Series) -> pd.Series:
+    """
+    First day of each (Year, Month) period
+    :param years: years as numbers
+    :param months: MONTH_DTYPE categorical
+    :return: datetime64 column, NaT where the year or month is missing
+    """
+    parts = pd.DataFrame({"year": years, "month": months.cat.codes + 1, "day": 1})
+    return pd.to_datetime(parts, errors="coerce").rename("Date")
+
+
+def month_axis(years, months):
+    """
+    x values of a monthly chart: the month names when every point is in one year,
+    "<Month> <Year>" otherwise, so that the same month of two years stays apart
+    :param years: Year of each point
+    :param months: Month of each point
+    """
+    years, months = pd.Series(years), pd.Series(months)
+    if years.nunique() <= 1:
+        return months
+    return months.astype(object) + " " + years.astype(str)
+
+
+def cast_column(values: pd.Series, kind: str) -> pd.Series:
+    """
+    Converts a column to its declared type
+    :param values: the raw column
+    :param kind: one of the type names used in SCHEMAS
+    :return: the converted column
+    """
+    if kind == "category":
+        return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+    if kind == "date":
+        return parse_dates(values, DATE_FORMAT)
+    if kind == "datetime":
+        return parse_dates(values, DATETIME_FORMAT)
+    if kind == "month":
+        return month_categorical(values)
+    if kind == "int":
+        return _to_int(values)
+    if kind in ("float32", "float64"):
+        return pd.to_numeric(values).astype(kind)
+    raise ValueError(f"Unknown column type '{kind}' for column {values.name}")
+
+
+def apply_schema(df: pd.DataFrame, worksheet: str) -> pd.DataFrame:
+    """
+    Converts the declared columns of a worksheet to their compact types.
+    A column that cannot be converted keeps its original values.
+    :param df: the raw worksheet frame
+    :param worksheet: name of the worksheet, used to look up its schema
+    :return: a new frame with typed columns
+    """
+    schema = SCHEMAS.get(worksheet, {})
+    converted = {}
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        try:
+            converted[col] = cast_column(df[col], kind)
+        except (ValueError, TypeError) as e:
+            logger.warning("Could not convert %s.%s to %s: %s", worksheet, col, kind, e)
+    return df.assign(**converted) if converted else df
+
+
+def derive_columns(df: pd.DataFrame, worksheet: str) -> pd.DataFrame:
+    """
+    Adds the DERIVED_COLUMNS of a worksheet whose source columns are present
+    :param df: the typed worksheet frame, as returned by apply_schema
+    :param worksheet: name of the worksheet, used to look up its derived columns
+    :return: a new frame with the derived columns
+    """
+    derived = {}
+    for col, derive in DERIVED_COLUMNS.get(worksheet, {}).items():
+        try:
+            derived[col] = derive(df)
+        except KeyError as e:
+            logger.warning("Could not derive %s.%s, missing column %s", worksheet, col, e)
+    return df.assign(**derived) if derived else df
+
+
+# read_only reaches into the pandas 1.x internals, see there
+_PANDAS_1 = pd.__version__.startswith("1.")
+
+
+def read_only(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Marks the column buffers of a prepared frame read-only, like those of a
+    memory-mapped frame, so that code editing a shared frame in place fails
+    instead of changing it for every session
+    Relies on the block manager of pandas 1.x (requirements.txt pins 1.5.0); with
+    other versions, or frames without blocks, the frame is left writable.
+    :param df: the frame, changed in place
+    :return: the same frame
+    """
+    # pandas has no public API for this; numeric, datetime and categorical blocks are numpy backed
+    blocks = getattr(getattr(df, "_mgr", None), "blocks", None)
+    if not _PANDAS_1 or blocks is None:
+        return df
+    for block in blocks:
+        values = getattr(block.values, "_ndarray", block.values)
+        if isinstance(values, np.ndarray):
+            values.flags.writeable = False
+    return df
+
+
+def align_categories(left: pd.DataFrame, right: pd.DataFrame, column: str):
+    """
+    Gives a categorical column the same categories in two frames, so that
+    merging on it keeps the categorical type instead of falling back to object
+    :return: tuple of (left, right) with aligned categories
+    """
+    if not (isinstance(left[column].dtype, pd.CategoricalDtype)
+            and isinstance(right[column].dtype, pd.CategoricalDtype)):
+        return left, right
+    categories = union_categoricals([left[column], right[column]]).categories
+    dtype = pd.CategoricalDtype(categories)
+    return left.assign(**{column: left[column].astype(dtype)}), right.assign(**{column: right[column].astype(dtype)})
+
+
+def concat_aligned(frames: list) -> pd.DataFrame:
+    """
+    Concatenates frames, unioning the categories of categorical columns so
+    they stay categorical instead of falling back to object
+    :param frames: frames with the same columns
+    :return: the concatenated frame with a fresh index
+    """
+    frames = [df for df in frames if not df.empty] or frames[:1]
+    columns = {}
+    for col in frames[0].columns:
+        values = [df[col] for df in frames]
+        if all(isinstance(v.dtype, pd.CategoricalDtype) for v in values) \
+                and any(v.dtype != values[0].dtype for v in values):
+            dtype = pd.CategoricalDtype(union_categoricals(values).categories, ordered=values[0].dtype.ordered)
+            columns[col] = dtype
+    if columns:
+        frames = [df.astype(columns) for df in frames]
+    return pd.concat(frames, ignore_index=True)
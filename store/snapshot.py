@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from constants import SNAPSHOT_DIR, WORKSHEETS
+from store.loader import LoadReport, load_concurrently
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# Worksheets are snapshotted from several loader threads, manifest updates must not interleave
+_manifest_lock = threading.RLock()
+
+
+def snapshot_path(worksheet: str, directory: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(directory, f"{worksheet}.feather")
+
+
+def part_path(worksheet: str, part: int, directory: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(directory, f"{worksheet}.part{part:04d}.feather")
+
+
+def read_manifest(directory: str = SNAPSHOT_DIR) -> dict:
+    """
+    Reads the snapshot manifest
+    :param directory: the snapshot directory
+    :return: worksheet name -> {"revision", "rows", "written_at", optional "parts" and "watermark"},
+             empty if there is no manifest
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_manifest(manifest: dict, directory: str):
+    tmp = os.path.join(directory, f"{MANIFEST}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+def _to_columnar(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Makes a worksheet frame storable as typed Arrow columns. Object columns
+    holding mixed values (e.g. numbers and blanks typed as text) become strings.
+    """
+    df = df.infer_objects().reset_index(drop=True)
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if not values.map(type).eq(str).all():
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _write_feather(df: pd.DataFrame, path: str):
+    tmp = f"{path}.tmp"
+    _to_columnar(df).to_feather(tmp)
+    os.replace(tmp, path)
+
+
+def _remove_parts(name: str, entry: dict, directory: str):
+    for part in range(1, entry.get("parts", 0) + 1):
+        try:
+            os.remove(part_path(name, part, directory))
+        except FileNotFoundError:
+            pass
+
+
+def write_snapshots(frames: dict, revisions: dict, directory: str = SNAPSHOT_DIR,
+                    watermarks: dict = None) -> list:
+    """
+    Writes each worksheet to a Feather file, skipping worksheets whose
+    revision is already on disk. Files are replaced atomically, so readers
+    never see a partially written snapshot.
+    :param frames: worksheet name -> DataFrame
+    :param revisions: worksheet name -> content revision
+    :param directory: the snapshot directory
+    :param watermarks: worksheet name -> last ingested date, for incremental worksheets (optional)
+    :return: names of the worksheets that were written
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _manifest_lock:
+        return _write_snapshots(frames, revisions, directory, watermarks)
+
+
+def _write_snapshots(frames: dict, revisions: dict, directory: str, watermarks: dict) -> list:
+    manifest = read_manifest(directory)
+    written = []
+    for name, df in frames.items():
+        revision = revisions.get(name)
+        if revision is not None and manifest.get(name, {}).get("revision") == revision \
+                and os.path.exists(snapshot_path(name, directory)):
+            continue
+        try:
+            _write_feather(df, snapshot_path(name, directory))
+        except Exception as e:
+            logger.warning("Could not write snapshot of %s: %s", name, e)
+            continue
+        # The full file replaces any appended parts
+        _remove_parts(name, manifest.get(name, {}), directory)
+        manifest[name] = {"revision": revision, "rows": len(df), "written_at": time.time()}
+        if watermarks and watermarks.get(name) is not None:
+            manifest[name]["watermark"] = watermarks[name]
+        written.append(name)
+    if written:
+        _write_manifest(manifest, directory)
+        logger.info("Wrote snapshots of %s", ", ".join(written))
+    return written
+
+
+def append_snapshot(name: str, rows: pd.DataFrame, revision: str, watermark: str,
+                    directory: str = SNAPSHOT_DIR) -> bool:
+    """
+    Appends new rows of a worksheet as a separate part file, so the cost
+    of the write depends on the new rows only
+    :param name: the worksheet name
+    :param rows: the rows to append
+    :param revision: revision of the worksheet including the new rows
+    :param watermark: last ingested date including the new rows
+    :param directory: the snapshot directory
+    :return: whether the rows were written
+    """
+    with _manifest_lock:
+        manifest = read_manifest(directory)
+        entry = manifest.get(name)
+        if entry is None or not os.path.exists(snapshot_path(name, directory)):
+            return False
+        part = entry.get("parts", 0) + 1
+        try:
+            _write_feather(rows, part_path(name, part, directory))
+        except Exception as e:
+            logger.warning("Could not append to snapshot of %s: %s", name, e)
+            return False
+        entry.update({"revision": revision, "rows": entry["rows"] + len(rows), "parts": part,
+                      "watermark": watermark, "written_at": time.time()})
+        _write_manifest(manifest, directory)
+        return True
+
+
+def read_snapshot(name: str, directory: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """
+    Reads a worksheet snapshot together with its appended parts
+    :param name: the worksheet name
+    :param directory: the snapshot directory
+    :return: DataFrame with the worksheet contents
+    """
+    df = pd.read_feather(snapshot_path(name, directory))
+    parts = read_manifest(directory).get(name, {}).get("parts", 0)
+    if not parts:
+        return df
+    frames = [df] + [pd.read_feather(part_path(name, part, directory)) for part in range(1, parts + 1)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_snapshots(directory: str = SNAPSHOT_DIR, worksheets=None) -> LoadReport:
+    """
+    Reads the worksheets from their local snapshots
+    :param directory: the snapshot directory
+    :param worksheets: names of the worksheets to read, defaults to all WORKSHEETS
+    :return: LoadReport with the frames, timings, errors and the revisions recorded in the manifest
+    """
+    worksheets = list(WORKSHEETS if worksheets is None else worksheets)
+    report = load_concurrently(lambda name: read_snapshot(name, directory), worksheets)
+    manifest = read_manifest(directory)
+    report.revisions = {name: manifest[name]["revision"] for name in report.frames
+                        if manifest.get(name, {}).get("revision")}
+    return report
+
+
+def has_snapshots(directory: str = SNAPSHOT_DIR, worksheets=None) -> bool:
+    """
+    Whether every worksheet has a snapshot on disk
+    """
+    worksheets = WORKSHEETS if worksheets is None else worksheets
+    manifest = read_manifest(directory)
+    return all(name in manifest and os.path.exists(snapshot_path(name, directory)) for name in worksheets)
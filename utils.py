@@ -1,31 +1,65 @@
 import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import plotly.graph_objects as go
-from plots.kpis import get_num_of_customers, get_clv, average_life_span, average_arpu, churn_rate
-from constants import MONTHS
+from plots.downsample import downsample
+from plots.kpis import OVERVIEW_KPIS, kpi_chart, overview_kpis
+from store.cube import CUSTOMERS, ROWS, count_column
+from store.daily import previous_window
+from store.partitions import YearPartitions
+from store.schema import DATE_FORMAT, month_axis, month_categorical, parse_dates
+
+
+def month_names(dates: pd.Series) -> pd.Series:
+    """
+    Ordered categorical of the abbreviated month names (Jan..Dec) of a datetime column
+    :param dates: datetime64 column
+    :return: ordered categorical column with the MONTHS categories
+    """
+    return month_categorical(dates.dt.month).rename("Month")
+
+
+def key_dates(keys: pd.Series) -> pd.Series:
+    """
+    Parses the date part of "<date>_<id>" keys, splitting and parsing
+    in Arrow rather than per row in Python
+    :param keys: column of key strings
+    :return: datetime64 column
+    """
+    prefixes = pc.list_element(pc.split_pattern(pa.array(keys, type=pa.string()), "_", max_splits=1), 0)
+    try:
+        dates = pc.strptime(prefixes, format=DATE_FORMAT, unit="ns").to_pandas()
+    except pa.ArrowInvalid:
+        dates = parse_dates(prefixes.to_pandas().rename(keys.name))
+    dates.index = keys.index
+    return dates
+
 
-      
 def preprocess_data(data_list: list) -> list:
     """
     Preprocesses the data by formatting date column
-    to contain values of datetime data-type
+    to contain values of datetime data-type. Every date column is parsed once
+    and Year (integer) and Month (ordered categorical) are derived from the
+    last date column of each frame.
     :param data_list: the list of dataframes with date column
     :return: list of dataframes with formatted date columns
     """
     for df in data_list:
+        period_source = None
         for col in df.columns:
-            if 'key' in col.lower():
-                try:
-                    df['Date'] = df[col].apply(lambda x: x.split("_")[0])
-                    df['Date'] = pd.to_datetime(df['Date'])
-                    df['Year'] = df['Date'].dt.year
-                    df['Month'] = df['Date'].dt.month_name().str[:3]
-                except IndexError:
-                    continue
+            if 'key' in col.lower() and pd.api.types.is_string_dtype(df[col]):
+                # Keys look like "<date>_<id>", the date is the part before the first "_"
+                df['Date'] = key_dates(df[col])
+                period_source = 'Date'
             if 'date' in col.lower():
-                df[col] = pd.to_datetime(df[col])
-                df['Year'] = df[col].dt.year
-                df['Month'] = df[col].dt.month_name().str[:3]
+                df[col] = parse_dates(df[col])
+                period_source = col
+        if period_source is not None:
+            dates = df[period_source]
+            years = dates.dt.year
+            df['Year'] = years if years.isna().any() else years.astype("int16")
+            df['Month'] = month_names(dates)
     return data_list
 
 
@@ -65,16 +99,28 @@ def update_hover_layout(fig: go.Figure) -> go.Figure:
     return fig
 
 
-def get_previous_month(month):
-    current = MONTHS.index(month)
-    previous = MONTHS[current - 1]
-    if previous == "Dec":
-        return 0
-    else:
-        return previous
-
-
-def current_and_previous_data(data, y, years):
+def current_and_previous_data(data, y=None, years=None, dates=None):
+    """
+    The rows of year y and of the year before it, the rows of y twice if there is none.
+    Given dates instead, the rows of that range of days and of the range of the same
+    length right before it, the rows of the range twice if that one has none.
+    :param data: prepared frame, or its YearPartitions to take both periods from without scanning
+    :param y: the selected year
+    :param years: sorted years of data, not needed for YearPartitions
+    :param dates: the selected (start, end) days, both included
+    :return: tuple of current and previous data
+    """
+    if dates is not None:
+        if isinstance(data, YearPartitions):
+            current_data, previous_data = data.between(*dates), data.between(*previous_window(*dates))
+        else:
+            days = data["Valuation Date"].dt.normalize()
+            (start, end), (p_start, p_end) = dates, previous_window(*dates)
+            current_data = data[(days >= start) & (days <= end)]
+            previous_data = data[(days >= p_start) & (days <= p_end)]
+        return current_data, previous_data if len(previous_data) else current_data
+    if isinstance(data, YearPartitions):
+        return data.current_and_previous(y)
     p_y = years.index(y) - 1
     current_data = data[data["Year"] == y]
     if p_y < 0:
@@ -85,46 +131,39 @@ def current_and_previous_data(data, y, years):
 
 
 def get_overview_kpis(current_data, previous_data):
-    num_of_customers = get_num_of_customers(current_data, previous_data)
-    clv = get_clv(current_data, previous_data)
-    avg_lsp = average_life_span(current_data, previous_data)
-    avg_arpu = average_arpu(current_data, previous_data)
-    churning = churn_rate(current_data, previous_data)
-
-    return num_of_customers, clv, avg_lsp, avg_arpu, churning
+    """
+    Indicator charts of the overview KPIs, computed in one pass per period
+    :return: tuple of figures: number of customers, CLV, average lifespan, ARPU and churn rate
+    """
+    kpis = overview_kpis(current_data, previous_data)
+    return tuple(kpi_chart(metric, kpis) for metric in OVERVIEW_KPIS)
 
 
-def get_conversion_rate(data: pd.DataFrame):
+def get_conversion_rate(totals: pd.Series):
     """
     Calculates the conversion rate.
 
-    :param data: DataFrame containing column 'Customer_ID'.
+    :param totals: sales cube totals (KpiCube.rollup()) with 'Customers' and 'Rows'.
     :return: Conversion rate as a percentage.
     """
-    try:
-        # Total number of rows or records
-        number_of_conversions = len(data)
-        # Number of unique Customer_IDs
-        number_of_visitors = data['Customer_ID'].nunique()
-        # Calculating conversion rate
-        conversion_rate = (number_of_visitors / number_of_conversions) * 100
-        return conversion_rate
-    except ZeroDivisionError:
+    if not totals[ROWS]:
         return 0
+    # Number of unique Customer_IDs per transaction
+    conversion_rate = (totals[CUSTOMERS] / totals[ROWS]) * 100
+    return conversion_rate
 
 
-def get_aov(data: pd.DataFrame):
+def get_aov(totals: pd.Series):
     """
     Calculates the Average Order Value (AOV).
 
-    :param data: DataFrame containing column 'Total Revenue_y'.
+    :param totals: sales cube totals (KpiCube.rollup()) with 'Total Revenue_y' and 'Rows'.
     :return: Average Order Value.
     """
-    try:
-        aov = data['Total Revenue_y'].sum() / len(data)
-        return aov
-    except ZeroDivisionError:
+    if not totals[ROWS]:
         return 0
+    aov = totals['Total Revenue_y'] / totals[ROWS]
+    return aov
 
 
 def get_rev_by_customer(data: pd.DataFrame):
@@ -134,67 +173,62 @@ def get_rev_by_customer(data: pd.DataFrame):
     :param data: DataFrame containing columns 'Customer_ID' and 'Total Revenue_y'.
     :return: Average revenue per customer.
     """
-    try:
-        revenue_by_customer = data.groupby('Customer_ID')['Total Revenue_y'].sum().mean()
-        return revenue_by_customer
-    except ZeroDivisionError:
+    if data.empty:
         return 0
+    revenue_by_customer = data.groupby('Customer_ID', observed=True)['Total Revenue_y'].sum().mean()
+    return revenue_by_customer
 
 
-def shipping_amount(data: pd.DataFrame):
+def shipping_amount(totals: pd.Series):
     """
     Calculates the shipping amount as a percentage of Total Revenue_y.
 
-    :param data: DataFrame containing columns 'Shipping Amount' and 'Total Revenue_y'.
+    :param totals: sales cube totals (KpiCube.rollup()) with 'Shipping Amount' and 'Total Revenue_y'.
     :return: Shipping amount percentage.
     """
-    try:
-        shipping_percentage = (data['Shipping Amount'].sum() / data['Total Revenue_y'].sum()) * 100
-        return shipping_percentage
-    except ZeroDivisionError:
+    if totals['Total Revenue_y'] == 0:
         return 0
+    shipping_percentage = (totals['Shipping Amount'] / totals['Total Revenue_y']) * 100
+    return shipping_percentage
 
 
-def tax_amount(data: pd.DataFrame):
+def tax_amount(totals: pd.Series):
     """
     Calculates the tax amount as a percentage of Total Revenue_y.
 
-    :param data: DataFrame containing columns 'Tax' and 'Total Revenue_y'.
+    :param totals: sales cube totals (KpiCube.rollup()) with 'Tax' and 'Total Revenue_y'.
     :return: Tax amount percentage.
     """
-    try:
-        tax_percentage = (data['Tax'].sum() / data['Total Revenue_y'].sum()) * 100
-        return tax_percentage
-    except ZeroDivisionError:
+    if totals['Total Revenue_y'] == 0:
         return 0
+    tax_percentage = (totals['Tax'] / totals['Total Revenue_y']) * 100
+    return tax_percentage
 
 
-def gross_profit_margin(data: pd.DataFrame):
+def gross_profit_margin(totals: pd.Series):
     """
     Calculates the gross profit margin.
 
-    :param data: DataFrame containing columns 'Gross Profit' and 'Total Revenue_y'.
+    :param totals: sales cube totals (KpiCube.rollup()) with 'Gross Profit' and 'Total Revenue_y'.
     :return: Gross profit margin percentage.
     """
-    try:
-        margin = (data['Gross Profit'].sum() / data['Total Revenue_y'].sum()) * 100
-        return margin
-    except ZeroDivisionError:
+    if totals['Total Revenue_y'] == 0:
         return 0
+    margin = (totals['Gross Profit'] / totals['Total Revenue_y']) * 100
+    return margin
 
 
-def get_discount_rate(data: pd.DataFrame):
+def get_discount_rate(totals: pd.Series):
     """
     Calculates the discount rate as a percentage of Total Revenue_y.
 
-    :param data: DataFrame containing columns 'Discount' and 'Total Revenue_y'.
+    :param totals: sales cube totals (KpiCube.rollup()) with 'Discount' and 'Total Revenue_y'.
     :return: Discount rate percentage.
     """
-    try:
-        discount_rate = (data['Discount'].sum() / data['Total Revenue_y'].sum()) * 100
-        return discount_rate
-    except ZeroDivisionError:
+    if totals['Total Revenue_y'] == 0:
         return 0
+    discount_rate = (totals['Discount'] / totals['Total Revenue_y']) * 100
+    return discount_rate
 
 def get_total_revenue(data):
     data["Total Revenue_y"] = data["Units Sold"] * data["Price Ratio"]
@@ -205,15 +239,19 @@ def get_sales_volume(data):
     return data["Units Sold"].sum()
 
 
-def get_conv_rate(df):
-    total_visitors = len(df)  # Total number of visitors
-    converted_visitors = df[df['Is Target'] == 1]  # Visitors who converted
-    conversion_rate = (len(converted_visitors) / total_visitors) * 100
+def get_conv_rate(totals):
+    total_visitors = totals[ROWS]  # Total number of visitors
+    if not total_visitors:
+        return 0
+    converted_visitors = totals['Is Target']  # Visitors who converted
+    conversion_rate = (converted_visitors / total_visitors) * 100
     return conversion_rate
 
 
-def get_visitor_engagement(df):
-    average_event_count = df['Event Sequence'].mean()
+def get_visitor_engagement(totals):
+    if not totals[count_column('Engagement')]:
+        return 0
+    average_event_count = totals['Engagement'] / totals[count_column('Engagement')]
     return average_event_count
 
 
@@ -221,8 +259,29 @@ def get_visitor_engagement(df):
 
 
 
-def get_attribution_indicators(df, column, name, value, prefix):
-    df["Event DateTime"] = pd.to_datetime(df["Event DateTime"])
+def get_attribution_indicators(totals, column, name, value, prefix, dates=None, channel=None, unit="D"):
+    """
+    Indicator of a marketing KPI over its series per day or hour
+    :param totals: hourly market totals per channel (store.daily.market_hourly)
+    :param column: measure to draw; measures with a count column (e.g. AOV) are drawn as
+                   their mean per period, others as their sum
+    :param name: title of the indicator
+    :param value: value shown by the indicator
+    :param prefix: prefix of the value, e.g. "$"
+    :param dates: (start, end) days to draw (optional)
+    :param channel: draw this channel only, all channels by default
+    :param unit: "D" or "h", one point per day or per hour
+    :return: the figure
+    """
+    start, end = dates if dates is not None else (None, None)
+
+    def series(measure):
+        sums = totals.series(measure, start, end, unit=unit)
+        return sums[channel] if channel is not None else sums.sum(axis=1)
+
+    y = series(column)
+    if count_column(column) in totals.measures:
+        y = y / series(count_column(column)).replace(0, float("nan"))
     fig = go.Figure()
     fig.add_trace(
         go.Indicator(
@@ -233,8 +292,8 @@ def get_attribution_indicators(df, column, name, value, prefix):
             domain={'y': [0, 1], 'x': [0.25, 0.75]}
         ))
     fig.add_trace(go.Scatter(
-        x=df["Event DateTime"],
-        y=df[column],
+        x=y.index,
+        y=y,
         mode="lines",
         # fill='tozeroy',
         name=name,
@@ -243,7 +302,8 @@ def get_attribution_indicators(df, column, name, value, prefix):
     fig.update_yaxes(showticklabels=False, showgrid=False)
     fig.update_layout(height=250)
     fig = update_hover_layout(fig)
-    return fig
+    # Hourly series of long ranges
+    return downsample(fig)
 
 
 def get_products_data(directory="./data", prefix="demand_forecast_output_ABC_Cereal_Bars"):
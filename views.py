@@ -5,11 +5,11 @@ from plots.accounts import ar_indicator, ap_indicator, profit_loss_chart, cashfl
     expenses_by_category, expense_treemap
 from plots.customer_report import cltv_by_month, rev_by_dash_segment, churn_by_dash_segment, sales_by_dash_segment, \
     conversion_and_purchase_rates, rev_by_loyalty_group, churn_wrt_loyalty, group_analysis
-from plots.marketing import event_seq_funnel, event_seq_pie, channels_performance, aov_by_channels, channel_funnel
+from plots.marketing import event_seq_funnel, event_seq_pie, channels_performance, aov_by_channels, channel_funnel, \
+    attribution_by_channel, channel_removal_effects
 from plots.overview import clv_by_cac_chart, debt_and_equity, income_statement
 from plots.sales_report import monthly_gross_rev, cost_breakdown_chart, sales_by_location, rev_by_products
 from plots.demand_elasticity import (
-    prepare_data,
     price_elasticity_overtime,
     elasticity_vs_base_price,
     shipping_vs_tax_ratio,
@@ -19,17 +19,58 @@ from plots.demand_elasticity import (
 from utils import current_and_previous_data, get_overview_kpis, get_conversion_rate, \
     get_aov, tax_amount, gross_profit_margin, get_discount_rate, shipping_amount, get_conv_rate, get_visitor_engagement, \
     format_currency_label
-from constants import MONTHS
-
-
-def overview(customers_sales_data, cash_flow_data):
+from plots.figures import FIGURES, cached_chart
+from store.cube import CUSTOMERS, count_column
+
+# Prepared frames each page reads, in the order of the page function's arguments.
+# Only these frames (and the worksheets behind them) are loaded for the page.
+# Charts read the monthly cubes (store.cube) rather than the transactions, KPIs
+# of a date range the daily totals (store.daily), funnel charts the funnel counts
+# (store.funnel) and attribution charts the journeys (store.attribution).
+PAGE_DATA = {
+    "overview": ["sales_by_year", "cash_flow_data", "sales_cube", "sales_daily"],
+    "sales_insights": ["sales_cube", "sales_daily", "sales_by_year"],
+    "customer_report": ["sales_cube", "sales_daily"],
+    "demand_elasticity": ["products_data", "products_cube", "products_elasticity"],
+    "marketing_attribution": ["market_cube", "market_daily", "media_daily", "market_funnel",
+                              "market_journeys"],
+    "accounts": ["cash_flow_data"],
+}
+
+
+def date_range(start, end, year=None):
+    """
+    Sidebar slider selecting a range of whole months, the grain of the monthly cubes
+    behind the charts, so that the KPIs of the range and the charts cover the same days
+    :param start: first day with data
+    :param end: last day with data
+    :param year: initially select the months of this year, every month otherwise
+    :return: tuple of the first day of the first selected month and the last day of the
+             last selected month, as Timestamps; None when there is no data to select
+    """
+    if pd.isna(start) or pd.isna(end):
+        st.info("There is no dated data to show yet.")
+        return None
+    months = pd.period_range(start, end, freq="M")
+    first, last = months[0], months[-1]
+    if year is not None and (months.year == year).any():
+        first, last = months[months.year == year][[0, -1]]
+    if len(months) > 1:
+        first, last = st.sidebar.select_slider(label="Months", options=list(months), value=(first, last),
+                                               format_func=lambda month: month.strftime("%b %Y"))
+    return first.start_time, last.end_time.normalize()
+
+
+def overview(sales_by_year, cash_flow_data, sales_cube, sales_daily):
     # -------------------------------- Filters ----------------------------------
-    year = st.sidebar.selectbox(label="Year", options=sorted(set(customers_sales_data["Year"].values)))
-    # ------------------------------- Data --------------------------------------
-    current_data, previous_data = current_and_previous_data(data=customers_sales_data, y=year,
-                                                            years=list(sorted(set(customers_sales_data["Year"].values))))
+    dates = date_range(sales_daily.start, sales_daily.end, year=min(sales_by_year.years, default=None))
+    if dates is None:
+        return
     # ------------------------------- KPIs --------------------------------------
-    num_of_customers, clv, avg_lsp, avg_arpu, churning = get_overview_kpis(current_data, previous_data)
+    # The selected days against as many days right before them
+    num_of_customers, clv, avg_lsp, avg_arpu, churning = FIGURES.get(
+        "utils.get_overview_kpis", (sales_by_year,), (dates,),
+        lambda: get_overview_kpis(*current_and_previous_data(data=sales_by_year, dates=dates)))
     kpi_row = st.columns(5)
     kpi_row[0].plotly_chart(num_of_customers, use_container_width=True)
     kpi_row[1].plotly_chart(clv, use_container_width=True)
@@ -39,71 +80,75 @@ def overview(customers_sales_data, cash_flow_data):
 
     row_1 = st.columns(2)
     # Income Statement
-    row_1[0].plotly_chart(income_statement(cash_flow_data), use_container_width=True)
+    row_1[0].plotly_chart(cached_chart(income_statement, cash_flow_data), use_container_width=True)
     # Debt to Equity Ratio
-    row_1[1].plotly_chart(debt_and_equity(cash_flow_data), use_container_width=True)
+    row_1[1].plotly_chart(cached_chart(debt_and_equity, cash_flow_data), use_container_width=True)
     # CLV:CAC chart
-    df = customers_sales_data[customers_sales_data["Year"] == year]
-    st.plotly_chart(clv_by_cac_chart(df), use_container_width=True)
+    st.plotly_chart(cached_chart(clv_by_cac_chart, sales_cube, filters=(dates,)), use_container_width=True)
 
 
-def sales_insights(data):
+def sales_insights(cube, daily, sales_by_year):
     # ----------------------------------- Filters -------------------------------
-    year = st.sidebar.selectbox(label="Year", options=sorted(set(data["Year"].values)))
-    data = data[data["Year"] == year]
+    dates = date_range(daily.start, daily.end, year=min(cube.years, default=None))
+    if dates is None:
+        return
+    totals = daily.totals(*dates)
+    totals[CUSTOMERS] = sales_by_year.between(*dates)["Customer_ID"].nunique()
     # ----------------------------------- KPIs ----------------------------------
     kpis = st.columns(6)
-    kpis[0].metric(label="Conversion Rate", value=f"{get_conversion_rate(data):.1f}%")
-    kpis[1].metric(label="Average Order Value", value=f"{get_aov(data):.1f}")
-    kpis[2].metric(label="Shipping Amount as %Revenue", value=f"{shipping_amount(data):.1f}%")
-    kpis[3].metric(label="Tax Amount as  %Revenue", value=f"{tax_amount(data):.1f}%")
-    kpis[4].metric(label="Gross Profit Margin", value=f"{gross_profit_margin(data):.1f}%")
-    kpis[5].metric(label="Discount Rate", value=f"{get_discount_rate(data):.1f}%")
+    kpis[0].metric(label="Conversion Rate", value=f"{get_conversion_rate(totals):.1f}%")
+    kpis[1].metric(label="Average Order Value", value=f"{get_aov(totals):.1f}")
+    kpis[2].metric(label="Shipping Amount as %Revenue", value=f"{shipping_amount(totals):.1f}%")
+    kpis[3].metric(label="Tax Amount as  %Revenue", value=f"{tax_amount(totals):.1f}%")
+    kpis[4].metric(label="Gross Profit Margin", value=f"{gross_profit_margin(totals):.1f}%")
+    kpis[5].metric(label="Discount Rate", value=f"{get_discount_rate(totals):.1f}%")
     # ------------------------------ Visuals ------------------------------------
     row_1 = st.columns(2)
     # Revenue/Gross Profit
-    row_1[0].plotly_chart(monthly_gross_rev(data), use_container_width=True)
+    row_1[0].plotly_chart(cached_chart(monthly_gross_rev, cube, filters=(dates,)), use_container_width=True)
     # Cost Breakdown
-    row_1[1].plotly_chart(cost_breakdown_chart(data), use_container_width=True)
+    row_1[1].plotly_chart(cached_chart(cost_breakdown_chart, cube, filters=(dates,)), use_container_width=True)
     # Sales by Location
-    row_1[0].plotly_chart(sales_by_location(data), use_container_width=True)
+    row_1[0].plotly_chart(cached_chart(sales_by_location, cube, filters=(dates,)), use_container_width=True)
     # Product Performance
-    row_1[1].plotly_chart(rev_by_products(data), use_container_width=True)
+    row_1[1].plotly_chart(cached_chart(rev_by_products, cube, filters=(dates,)), use_container_width=True)
 
 
-def customer_report(data):
+def customer_report(cube, daily):
     # ----------------------------------- Filters -------------------------------
-    year = st.sidebar.selectbox(label="Year", options=sorted(set(data["Year"].values)))
+    dates = date_range(daily.start, daily.end, year=min(cube.years, default=None))
+    if dates is None:
+        return
     # month = st.sidebar.multiselect(label="Month", options=months,
     #                                placeholder="All")
-    data = data[data["Year"] == year]
-    data["Churn"] = data["P notAlive"].apply(lambda x: 1 if x > 0.5 else 0)
     # ---------------------------- Visuals ----------------------------
     row_1 = st.columns(2)
     # Churn & Revenue Analysis/Dash Segment
-    row_1[0].plotly_chart(group_analysis(data, "Dash Segment"), use_container_width=True)
+    row_1[0].plotly_chart(cached_chart(group_analysis, cube, filters=(dates, "Dash Segment")),
+                          use_container_width=True)
     # Churn & Revenue Analysis/Loyalty Groups
-    row_1[1].plotly_chart(group_analysis(data, "Loyalty Group"), use_container_width=True)
+    row_1[1].plotly_chart(cached_chart(group_analysis, cube, filters=(dates, "Loyalty Group")),
+                          use_container_width=True)
 
     # Churn Analysis/Dash Segment
-    # row_1[0].plotly_chart(churn_by_dash_segment(data), use_container_width=True)
+    # row_1[0].plotly_chart(cached_chart(churn_by_dash_segment, cube, filters=(dates,)), use_container_width=True)
     # # Dash Segment Analysis
-    # row_1[1].plotly_chart(rev_by_dash_segment(data), use_container_width=True)
+    # row_1[1].plotly_chart(cached_chart(rev_by_dash_segment, cube, filters=(dates,)), use_container_width=True)
     # # Churn Analysis/Loyalty Groups
-    # row_1[2].plotly_chart(churn_wrt_loyalty(data), use_container_width=True)
+    # row_1[2].plotly_chart(cached_chart(churn_wrt_loyalty, cube, filters=(dates,)), use_container_width=True)
     # # Loyalty Group
-    # row_1[3].plotly_chart(rev_by_loyalty_group(data), use_container_width=True)
+    # row_1[3].plotly_chart(cached_chart(rev_by_loyalty_group, cube, filters=(dates,)), use_container_width=True)
 
     row_2 = st.columns(2)
     # Average CLTV by Month
-    row_2[0].plotly_chart(cltv_by_month(data), use_container_width=True)
+    row_2[0].plotly_chart(cached_chart(cltv_by_month, cube, filters=(dates,)), use_container_width=True)
     # Sales by Loyalty Groups
-    row_2[1].plotly_chart(sales_by_dash_segment(data), use_container_width=True)
+    row_2[1].plotly_chart(cached_chart(sales_by_dash_segment, cube, filters=(dates,)), use_container_width=True)
     # Conversion Rate & Repeat Purchase Rate
-    st.plotly_chart(conversion_and_purchase_rates(data), use_container_width=True)
+    st.plotly_chart(cached_chart(conversion_and_purchase_rates, cube, filters=(dates,)), use_container_width=True)
 
 
-def demand_elasticity(data):
+def demand_elasticity(data, products_cube, products_elasticity):
     """
     Display demand elasticity analysis in the Streamlit app
     """
@@ -113,81 +158,94 @@ def demand_elasticity(data):
         # Debug information
         #st.write("Available columns:", data.columns.tolist())
         
-        # Prepare data once for all visualizations
-        processed_data = prepare_data(data)
-        
+        # Trends read the Product × Year × Month cube and the elasticities estimated
+        # from it, both built once per data version
         # Create two columns for the layout
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("Price Elasticity Over Time")
-            fig1 = price_elasticity_overtime(processed_data)
+            fig1 = cached_chart(price_elasticity_overtime, products_elasticity)
             st.plotly_chart(fig1, use_container_width=True)
 
             
 
         with col2:
             st.subheader("Sales Volume Analysis")
-            fig2 = sales_volume_overtime(processed_data)
+            fig2 = cached_chart(sales_volume_overtime, products_cube)
             st.plotly_chart(fig2, use_container_width=True)
         
         # with col2:
         #     st.subheader("Price Elasticity vs Base Price")
-        #     fig3 = elasticity_vs_base_price(processed_data)
+        #     fig3 = cached_chart(elasticity_vs_base_price, data)
         #     st.plotly_chart(fig3, use_container_width=True)
         
         st.subheader("Price and Quantity Analysis")
-        fig4 = price_and_qty_overtime(processed_data)
+        fig4 = cached_chart(price_and_qty_overtime, products_cube)
         st.plotly_chart(fig4, use_container_width=True)
         
         # Full width chart at the bottom
         st.subheader("Shipping and Tax Impact")
-        fig5 = shipping_vs_tax_ratio(processed_data)
+        fig5 = cached_chart(shipping_vs_tax_ratio, data)
         st.plotly_chart(fig5, use_container_width=True)
         
     except Exception as e:
         st.error(f"Error in demand elasticity analysis: {str(e)}")
         st.write("Please make sure your data contains the following columns:")
-        st.write("- Date (or a column containing dates)")
-        st.write("- Price Elasticity")
+        st.write("- Year and Month")
+        st.write("- Price Ratio")
         st.write("- Base Price")
         st.write("- Units Sold")
         st.write("- Product")
 
 
 
-def marketing_attribution(market_data, media_data):
+def marketing_attribution(market_cube, market_daily, media_daily, market_funnel, market_journeys):
+    dates = date_range(market_daily.start, market_daily.end)
+    if dates is None:
+        return
     kpis_row = st.columns(5)
-    conversion_rate = get_conv_rate(market_data)
-    visitor_engagement = get_visitor_engagement(market_data)
-    kpis_row[1].metric(label="Average Order Value", value=f"${market_data['AOV'].mean():.2f}")
-    kpis_row[2].metric(label="Total Revenue", value=f"${market_data['AOV'].sum():.1f}")
+    totals = market_daily.totals(*dates)
+    conversion_rate = get_conv_rate(totals)
+    visitor_engagement = get_visitor_engagement(totals)
+    orders = totals[count_column('AOV')]
+    kpis_row[1].metric(label="Average Order Value", value=f"${totals['AOV'] / orders if orders else 0:.2f}")
+    kpis_row[2].metric(label="Total Revenue", value=f"${totals['AOV']:.1f}")
     kpis_row[3].metric(label="Visitor's Engagement Rate", value=f"{visitor_engagement:.2f}")
 
     st.write("---")
     row_1 = st.columns(2)
 
     # Event Sequence Funnel
-    row_1[1].plotly_chart(event_seq_funnel(market_data), use_container_width=True)
+    row_1[1].plotly_chart(cached_chart(event_seq_funnel, market_funnel, filters=(dates,)), use_container_width=True)
     # AOV w.r.t Event Sequence
-    row_1[0].plotly_chart(event_seq_pie(market_data), use_container_width=True)
+    row_1[0].plotly_chart(cached_chart(event_seq_pie, market_cube, filters=(dates,)), use_container_width=True)
     # Spend and Conversion w.r.t Channels
-    st.plotly_chart(channel_funnel(media_data, market_data), use_container_width=True)
+    st.plotly_chart(cached_chart(channel_funnel, media_daily, market_funnel, filters=(dates,)),
+                    use_container_width=True)
 
     # Channels Performance
     row_2 = st.columns(2)
-    row_2[0].plotly_chart(channels_performance(market_data), use_container_width=True)
+    row_2[0].plotly_chart(cached_chart(channels_performance, market_cube, filters=(dates,)), use_container_width=True)
     # AOV w.r.t Channels
-    row_2[1].plotly_chart(aov_by_channels(market_data), use_container_width=True)
+    row_2[1].plotly_chart(cached_chart(aov_by_channels, market_cube, filters=(dates,)), use_container_width=True)
+
+    # Multi-touch attribution of the journeys ending in the selected days
+    row_3 = st.columns(2)
+    row_3[0].plotly_chart(cached_chart(attribution_by_channel, market_journeys, filters=(dates,)),
+                          use_container_width=True)
+    row_3[1].plotly_chart(cached_chart(channel_removal_effects, market_journeys, filters=(dates,)),
+                          use_container_width=True)
 
 
 def accounts(data):
-    year = st.sidebar.multiselect(label="Year", options=sorted(set(data["Year"].values)), placeholder="All")
-    if not year:
-        year = sorted(set(data["Year"].values))
-    df = data[data['Year'].isin(year)]
-    df = df.sort_values(by="Valuation Date")
-    income_data = data[data["Year"].isin(year)]
+    days = data["Valuation Date"].dt.normalize()
+    dates = date_range(days.min(), days.max())
+    if dates is None:
+        return
+    start, end = dates
+    income_data = data[(days >= start) & (days <= end)]
+    df = income_data.sort_values(by="Valuation Date")
 
     # KPIs
     kpi_row = st.columns(6)